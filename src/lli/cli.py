@@ -7,13 +7,12 @@ merge, split, config, and stats.
 
 from __future__ import annotations
 
-import asyncio
 import re
 import socket
 import sys
 import threading
 from pathlib import Path
-from typing import TYPE_CHECKING, Literal
+from typing import TYPE_CHECKING, Literal, cast
 from urllib.parse import urlparse
 
 import click
@@ -25,6 +24,8 @@ from lli.config import get_cert_info, get_default_trace_dir, load_config
 from lli.net import detect_primary_ipv4, reachable_host_for_listen_host
 
 if TYPE_CHECKING:
+    import asyncio
+
     from lli.config import LLIConfig
     from lli.watch import WatchManager
 
@@ -217,7 +218,7 @@ def config(
     elif proxy_help:
         _show_proxy_help()
     elif show:
-        _show_config(ctx.obj.get("config_path"))
+        _show_config(_get_config(ctx))
     else:
         # Show all help by default
         _show_cert_help()
@@ -225,135 +226,151 @@ def config(
         _show_proxy_help()
 
 
+def _get_config(ctx: click.Context) -> LLIConfig:
+    """Return the configuration for this invocation, loading it once on first use."""
+    if "config" not in ctx.obj:
+        ctx.obj["config"] = load_config(ctx.obj.get("config_path"))
+    config: LLIConfig = ctx.obj["config"]
+    return config
+
+
 def _show_cert_help() -> None:
     """Display certificate installation instructions."""
+    lines: list[str] = []
     cert_info = get_cert_info()
 
-    console.print("[bold cyan]Certificate Installation Guide[/]")
-    console.print("=" * 50)
-    console.print()
+    lines.append("[bold cyan]Certificate Installation Guide[/]")
+    lines.append("=" * 50)
+    lines.append("")
 
-    console.print(f"[dim]Certificate path:[/] {cert_info['cert_path']}")
+    lines.append(f"[dim]Certificate path:[/] {cert_info['cert_path']}")
     exists_text = (
         "[green]Yes[/]" if cert_info["exists"] else "[yellow]No (will be generated on first run)[/]"
     )
-    console.print(f"[dim]Certificate exists:[/] {exists_text}")
-    console.print()
-
-    console.print("[bold]macOS:[/]")
-    console.print("  1. Run the proxy once to generate the certificate")
-    console.print(f"  2. Open: {cert_info['cert_path']}")
-    console.print("  3. Double-click to add to Keychain")
-    console.print("  4. In Keychain Access, find 'mitmproxy'")
-    console.print("  5. Double-click → Trust → 'Always Trust'")
-    console.print()
-
-    console.print("[bold]Linux:[/]")
-    console.print("  # Ubuntu/Debian:")
-    console.print(
+    lines.append(f"[dim]Certificate exists:[/] {exists_text}")
+    lines.append("")
+
+    lines.append("[bold]macOS:[/]")
+    lines.append("  1. Run the proxy once to generate the certificate")
+    lines.append(f"  2. Open: {cert_info['cert_path']}")
+    lines.append("  3. Double-click to add to Keychain")
+    lines.append("  4. In Keychain Access, find 'mitmproxy'")
+    lines.append("  5. Double-click → Trust → 'Always Trust'")
+    lines.append("")
+
+    lines.append("[bold]Linux:[/]")
+    lines.append("  # Ubuntu/Debian:")
+    lines.append(
         f"  sudo cp {cert_info['cert_path']} /usr/local/share/ca-certificates/mitmproxy.crt"
     )
-    console.print("  sudo update-ca-certificates")
-    console.print()
-    console.print("  # Fedora/RHEL:")
-    console.print(f"  sudo cp {cert_info['cert_path']} /etc/pki/ca-trust/source/anchors/")
-    console.print("  sudo update-ca-trust")
-    console.print()
+    lines.append("  sudo update-ca-certificates")
+    lines.append("")
+    lines.append("  # Fedora/RHEL:")
+    lines.append(f"  sudo cp {cert_info['cert_path']} /etc/pki/ca-trust/source/anchors/")
+    lines.append("  sudo update-ca-trust")
+    lines.append("")
+
+    lines.append("[bold]Windows:[/]")
+    lines.append(f"  1. Open: {cert_info['cert_path']}")
+    lines.append("  2. Click 'Install Certificate'")
+    lines.append("  3. Select 'Local Machine' → Next")
+    lines.append("  4. 'Place all certificates in the following store'")
+    lines.append("  5. Browse → 'Trusted Root Certification Authorities'")
+    lines.append("  6. Finish")
 
-    console.print("[bold]Windows:[/]")
-    console.print(f"  1. Open: {cert_info['cert_path']}")
-    console.print("  2. Click 'Install Certificate'")
-    console.print("  3. Select 'Local Machine' → Next")
-    console.print("  4. 'Place all certificates in the following store'")
-    console.print("  5. Browse → 'Trusted Root Certification Authorities'")
-    console.print("  6. Finish")
+    console.print("\n".join(lines))
 
 
 def _show_proxy_help() -> None:
     """Display proxy configuration instructions."""
+    lines: list[str] = []
     config = load_config()
-    console.print("[bold cyan]Proxy Configuration Guide[/]")
-    console.print("=" * 50)
-    console.print()
+    lines.append("[bold cyan]Proxy Configuration Guide[/]")
+    lines.append("=" * 50)
+    lines.append("")
 
-    console.print("[bold]Environment Variables (Shell):[/]")
-    console.print("  export HTTP_PROXY=http://127.0.0.1:9090")
-    console.print("  export HTTPS_PROXY=http://127.0.0.1:9090")
+    lines.append("[bold]Environment Variables (Shell):[/]")
+    lines.append("  export HTTP_PROXY=http://127.0.0.1:9090")
+    lines.append("  export HTTPS_PROXY=http://127.0.0.1:9090")
     if config.proxy.no_proxy:
-        console.print(f"  export NO_PROXY={','.join(config.proxy.no_proxy)}")
-    console.print()
-
-    console.print("[bold]Claude Code:[/]")
-    console.print("  # Set in your shell before running claude:")
-    console.print("  export HTTP_PROXY=http://127.0.0.1:9090")
-    console.print("  export HTTPS_PROXY=http://127.0.0.1:9090")
-    console.print("  claude")
-    console.print()
-
-    console.print("[bold]Cursor IDE:[/]")
-    console.print("  # Add to your shell profile (.bashrc, .zshrc):")
-    console.print("  export HTTP_PROXY=http://127.0.0.1:9090")
-    console.print("  export HTTPS_PROXY=http://127.0.0.1:9090")
-    console.print("  # Then restart Cursor from that terminal")
-    console.print()
-
-    console.print("[bold]curl:[/]")
-    console.print("  curl -x http://127.0.0.1:9090 https://api.anthropic.com/v1/messages ...")
-    console.print()
-
-    console.print("[bold]Python requests:[/]")
-    console.print("  import requests")
-    console.print('  proxies = {"http": "http://127.0.0.1:9090", "https": "http://127.0.0.1:9090"}')
-    console.print("  requests.post(url, proxies=proxies, verify=False)")
-    console.print()
-    console.print("[bold]LAN capture (listen on all interfaces):[/]")
-    console.print("  lli watch --lan")
-    console.print("  # It will print the detected LAN IP + port for you.")
-
-
-def _show_config(config_path: str | None) -> None:
+        lines.append(f"  export NO_PROXY={','.join(config.proxy.no_proxy)}")
+    lines.append("")
+
+    lines.append("[bold]Claude Code:[/]")
+    lines.append("  # Set in your shell before running claude:")
+    lines.append("  export HTTP_PROXY=http://127.0.0.1:9090")
+    lines.append("  export HTTPS_PROXY=http://127.0.0.1:9090")
+    lines.append("  claude")
+    lines.append("")
+
+    lines.append("[bold]Cursor IDE:[/]")
+    lines.append("  # Add to your shell profile (.bashrc, .zshrc):")
+    lines.append("  export HTTP_PROXY=http://127.0.0.1:9090")
+    lines.append("  export HTTPS_PROXY=http://127.0.0.1:9090")
+    lines.append("  # Then restart Cursor from that terminal")
+    lines.append("")
+
+    lines.append("[bold]curl:[/]")
+    lines.append("  curl -x http://127.0.0.1:9090 https://api.anthropic.com/v1/messages ...")
+    lines.append("")
+
+    lines.append("[bold]Python requests:[/]")
+    lines.append("  import requests")
+    lines.append('  proxies = {"http": "http://127.0.0.1:9090", "https": "http://127.0.0.1:9090"}')
+    lines.append("  requests.post(url, proxies=proxies, verify=False)")
+    lines.append("")
+    lines.append("[bold]LAN capture (listen on all interfaces):[/]")
+    lines.append("  lli watch --lan")
+    lines.append("  # It will print the detected LAN IP + port for you.")
+
+    console.print("\n".join(lines))
+
+
+def _show_config(config: LLIConfig) -> None:
     """Display current configuration."""
-    config = load_config(config_path)
+    lines: list[str] = []
 
-    console.print("[bold cyan]Current Configuration[/]")
-    console.print("=" * 50)
-    console.print()
+    lines.append("[bold cyan]Current Configuration[/]")
+    lines.append("=" * 50)
+    lines.append("")
 
     # Proxy settings
-    console.print("[bold]Proxy:[/]")
-    console.print(f"  Host: {config.proxy.host}")
-    console.print(f"  Port: {config.proxy.port}")
+    lines.append("[bold]Proxy:[/]")
+    lines.append(f"  Host: {config.proxy.host}")
+    lines.append(f"  Port: {config.proxy.port}")
     if config.proxy.no_proxy:
-        console.print(f"  No-proxy: {', '.join(config.proxy.no_proxy)}")
+        lines.append(f"  No-proxy: {', '.join(config.proxy.no_proxy)}")
     else:
-        console.print("  No-proxy: (not set)")
+        lines.append("  No-proxy: (not set)")
     if config.proxy.upstream_ca_cert:
-        console.print(f"  Upstream CA cert: {config.proxy.upstream_ca_cert}")
+        lines.append(f"  Upstream CA cert: {config.proxy.upstream_ca_cert}")
     else:
-        console.print("  Upstream CA cert: (not set)")
-    console.print()
+        lines.append("  Upstream CA cert: (not set)")
+    lines.append("")
 
     # Filter settings
-    console.print("[bold]URL Filters:[/]")
-    console.print("  Include patterns:")
+    lines.append("[bold]URL Filters:[/]")
+    lines.append("  Include patterns:")
     for pattern in config.filter.include_patterns:
-        console.print(f"    - {pattern}")
+        lines.append(f"    - {pattern}")
     if config.filter.exclude_patterns:
-        console.print("  Exclude patterns:")
+        lines.append("  Exclude patterns:")
         for pattern in config.filter.exclude_patterns:
-            console.print(f"    - {pattern}")
-    console.print()
+            lines.append(f"    - {pattern}")
+    lines.append("")
 
     # Storage settings
-    console.print("[bold]Storage:[/]")
-    console.print(f"  Output file: {config.storage.output_file}")
-    console.print(f"  Pretty JSON: {config.storage.pretty_json}")
-    console.print()
+    lines.append("[bold]Storage:[/]")
+    lines.append(f"  Output file: {config.storage.output_file}")
+    lines.append(f"  Pretty JSON: {config.storage.pretty_json}")
+    lines.append("")
 
     # Masking settings
-    console.print("[bold]Masking:[/]")
-    console.print(f"  Mask auth headers: {config.masking.mask_auth_headers}")
-    console.print(f"  Sensitive headers: {', '.join(config.masking.sensitive_headers)}")
+    lines.append("[bold]Masking:[/]")
+    lines.append(f"  Mask auth headers: {config.masking.mask_auth_headers}")
+    lines.append(f"  Sensitive headers: {', '.join(config.masking.sensitive_headers)}")
+
+    console.print("\n".join(lines))
 
 
 @main.command()
@@ -501,7 +518,7 @@ def watch(
     from lli.watch import WatchManager
 
     # Load configuration
-    config = load_config(ctx.obj.get("config_path"))
+    config = _get_config(ctx)
 
     # Apply CLI overrides only when explicitly provided
     port_source = ctx.get_parameter_source("port")
@@ -607,9 +624,11 @@ def watch(
 
     def run_proxy_in_thread() -> None:
         """Run the proxy in a separate thread."""
+        import asyncio
+
         from lli.proxy import run_watch_proxy
 
-        loop = asyncio.new_event_loop()
+        loop = _new_event_loop()
         asyncio.set_event_loop(loop)
         try:
             loop.run_until_complete(run_watch_proxy(config, watch_manager))
@@ -957,5 +976,19 @@ def _is_port_in_use(host: str, port: int) -> bool:
     return False
 
 
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+    """Create the proxy event loop, using uvloop when it is installed (not on Windows)."""
+    import asyncio
+
+    if sys.platform != "win32":
+        try:
+            import uvloop
+        except ImportError:
+            pass
+        else:
+            return cast(asyncio.AbstractEventLoop, uvloop.new_event_loop())
+    return asyncio.new_event_loop()
+
+
 if __name__ == "__main__":
     main(obj={})
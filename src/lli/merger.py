@@ -4,16 +4,88 @@ Stream merger utility for LLM Interceptor.
 Aggregates streaming response chunks into complete request-response pairs.
 """
 
-import json
-from collections import defaultdict
+import functools
+import os
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 from typing import Any
+from urllib.parse import urlparse
+
+import orjson
 
 from lli.logger import get_logger
 from lli.models import ToolCall
 from lli.storage import JSONLWriter, read_jsonl
 
+# Number of merged records collected before handing them to the writer
+_WRITE_BATCH_SIZE = 1024
+
+# Bounds for the output file buffer, which is sized from the input file
+_MIN_WRITE_BUFFER_SIZE = 1 << 16
+_MAX_WRITE_BUFFER_SIZE = 1 << 23
+
+# Record types consumed by the merger; anything else is skipped immediately
+_MERGE_RECORD_TYPES = frozenset({"request", "response_chunk", "response_meta", "response"})
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_iso_timestamp(ts: str) -> datetime | None:
+    """
+    Parse an ISO timestamp string, or return None if it is not one.
+
+    Chunks of one response share a timestamp, so results are cached.
+    """
+    # Handle ISO format with Z suffix
+    ts = ts.removesuffix("Z")
+    try:
+        return datetime.fromisoformat(ts)
+    except ValueError:
+        return None
+
+
+def _host_in_domain(host: str, domain: str) -> bool:
+    """Return True if host is domain itself or one of its subdomains."""
+    return host == domain or host.endswith("." + domain)
+
+
+def _chunk_sort_key(chunk: dict[str, Any]) -> int:
+    """Return the ordering key for a response chunk (its numeric chunk_index)."""
+    chunk_index = chunk.get("chunk_index", 0)
+    return int(chunk_index) if str(chunk_index).isdigit() else 0
+
+
+@dataclass(slots=True)
+class _MergeState:
+    """Records accumulated for a single request while merging."""
+
+    request: dict[str, Any] | None = None
+    chunks: list[dict[str, Any]] = field(default_factory=list)
+    meta: dict[str, Any] | None = None
+    response: dict[str, Any] | None = None
+    last_chunk_key: int = -1
+    chunks_in_order: bool = True
+
+    def add_chunk(self, chunk: dict[str, Any]) -> None:
+        """Append a chunk, noting whether chunks still arrive in index order."""
+        key = _chunk_sort_key(chunk)
+        if key < self.last_chunk_key:
+            self.chunks_in_order = False
+        else:
+            self.last_chunk_key = key
+        self.chunks.append(chunk)
+
+    def is_complete(self) -> bool:
+        """Return True once the request and its final response record have been seen."""
+        return self.request is not None and (self.meta is not None or self.response is not None)
+
+    def sorted_chunks(self) -> list[dict[str, Any]]:
+        """Return chunks ordered by chunk_index, sorting only when needed."""
+        if self.chunks_in_order:
+            return self.chunks
+        return sorted(self.chunks, key=_chunk_sort_key)
+
 
 class StreamMerger:
     """
@@ -41,116 +113,40 @@ class StreamMerger:
         self.session_id = session_id
         self._logger = get_logger()
 
+        # Create the output directory once; the writer is told to skip it
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+
     def merge(self) -> dict[str, int]:
         """
         Perform the merge operation.
         ...
         """
         self._logger.info("Reading records from %s", self.input_path)
-        records = read_jsonl(self.input_path)
-
-        # Group records by request_id
-        requests: dict[str, dict[str, Any]] = {}
-        chunks: dict[str, list[dict[str, Any]]] = defaultdict(list)
-        metas: dict[str, dict[str, Any]] = {}
-        non_streaming: dict[str, dict[str, Any]] = {}
-
-        # Track order of requests
-        request_order: list[str] = []
-
-        for record in records:
-            # Filter by session ID if requested
-            if self.session_id:
-                record_session_id = record.get("_session_id")
-                # Allow records with matching session ID or None (for robustness)
-                if record_session_id and record_session_id != self.session_id:
-                    self._logger.debug(
-                        "Skipping record with mismatching session ID: %s (expected %s)",
-                        record_session_id,
-                        self.session_id,
-                    )
-                    continue
-
-            record_type = record.get("type", "")
-
-            if record_type == "request":
-                request_id = record["id"]
-                requests[request_id] = record
-                request_order.append(request_id)
-            elif record_type == "response_chunk":
-                request_id = record.get("request_id")
-                if request_id:
-                    chunks[request_id].append(record)
-            elif record_type == "response_meta":
-                request_id = record.get("request_id")
-                if request_id:
-                    metas[request_id] = record
-            elif record_type == "response":
-                # Non-streaming response
-                request_id = record.get("request_id")
-                if request_id:
-                    non_streaming[request_id] = record
 
-        self._logger.info(
-            "Found %d requests, %d chunks, %d non-streaming responses",
-            len(requests),
-            sum(len(c) for c in chunks.values()),
-            len(non_streaming),
-        )
-
-        # Process and write records
         stats = {
-            "total_requests": len(requests),
+            "total_requests": 0,
             "streaming_requests": 0,
             "non_streaming_requests": 0,
             "incomplete_requests": 0,
             "total_chunks_processed": 0,
         }
 
-        with JSONLWriter(self.output_path, append=False) as writer:
-            for request_id in request_order:
-                if request_id not in requests:
-                    continue
-
-                request = requests[request_id]
-
-                # Check if this was a streaming or non-streaming request
-                if request_id in chunks:
-                    # Streaming request - write request then merged response
-                    writer.write_record(request)
-
-                    request_chunks = sorted(
-                        chunks[request_id],
-                        key=lambda x: int(x.get("chunk_index", 0))
-                        if str(x.get("chunk_index", 0)).isdigit()
-                        else 0,
-                    )
-                    meta = metas.get(request_id, {})
-
-                    # Detect API format and rebuild response
-                    api_format = self._detect_api_format(request_chunks)
-                    if api_format == "anthropic":
-                        response = self._rebuild_anthropic_response(
-                            request_id, request_chunks, meta
-                        )
-                    else:
-                        response = self._rebuild_openai_response(request_id, request_chunks, meta)
-
-                    writer.write_record(response)
-                    stats["streaming_requests"] += 1
-                    stats["total_chunks_processed"] += len(request_chunks)
-
-                elif request_id in non_streaming:
-                    # Non-streaming request - write request then response as-is
-                    writer.write_record(request)
-                    writer.write_record(non_streaming[request_id])
-                    stats["non_streaming_requests"] += 1
+        # Merged output is roughly proportional to the input; size the buffer to match
+        buffer_size = min(
+            max(self.input_path.stat().st_size // 8, _MIN_WRITE_BUFFER_SIZE),
+            _MAX_WRITE_BUFFER_SIZE,
+        )
 
-                else:
-                    # Request without response - only write request
-                    writer.write_record(request)
-                    self._logger.warning("Request %s... has no response", request_id[:8])
-                    stats["incomplete_requests"] += 1
+        # Write to a temporary file next to the output and move it into place
+        # at the end, so that merging a file onto itself (or a failed merge)
+        # never truncates the input or leaves a partial output behind
+        tmp_path = self.output_path.with_name(f".{self.output_path.name}.{os.getpid()}.tmp")
+        try:
+            self._merge_into(tmp_path, buffer_size, stats)
+            os.replace(tmp_path, self.output_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
 
         self._logger.info(
             "Wrote %d request-response pairs to %s",
@@ -160,16 +156,184 @@ class StreamMerger:
 
         return stats
 
-    def _detect_api_format(self, chunks: list[dict[str, Any]]) -> str:
+    def _merge_into(
+        self,
+        tmp_path: Path,
+        buffer_size: int,
+        stats: dict[str, int],
+    ) -> None:
+        """Stream the input and write merged records to tmp_path, updating stats."""
+        # Group records by request_id into a single state table
+        states: dict[str, _MergeState] = {}
+
+        # Requests not yet written, in the order they were first seen
+        pending: deque[str] = deque()
+
+        chunk_count = 0
+        non_streaming_count = 0
+        states_get = states.get
+        session_filter = self.session_id
+
+        with JSONLWriter(
+            tmp_path,
+            append=False,
+            buffer_size=buffer_size,
+            ensure_parent=False,
+        ) as writer:
+            batch: list[dict[str, Any]] = []
+
+            for record in read_jsonl(self.input_path):
+                record_type = record.get("type")
+                if record_type not in _MERGE_RECORD_TYPES:
+                    continue
+
+                # Filter by session ID if requested
+                if session_filter:
+                    record_session_id = record.get("_session_id")
+                    # Allow records with matching session ID or None (for robustness)
+                    if record_session_id and record_session_id != session_filter:
+                        self._logger.debug(
+                            "Skipping record with mismatching session ID: %s (expected %s)",
+                            record_session_id,
+                            session_filter,
+                        )
+                        continue
+
+                match record_type:
+                    case "request":
+                        request_id = record["id"]
+                        state = states_get(request_id)
+                        if state is None:
+                            state = states[request_id] = _MergeState()
+                        if state.request is None:
+                            pending.append(request_id)
+                            stats["total_requests"] += 1
+                        state.request = record
+                    case "response_chunk":
+                        request_id = record.get("request_id")
+                        if request_id:
+                            state = states_get(request_id)
+                            if state is None:
+                                state = states[request_id] = _MergeState()
+                            state.add_chunk(record)
+                            chunk_count += 1
+                        continue
+                    case "response_meta":
+                        request_id = record.get("request_id")
+                        if not request_id:
+                            continue
+                        state = states_get(request_id)
+                        if state is None:
+                            state = states[request_id] = _MergeState()
+                        state.meta = record
+                    case "response":
+                        # Non-streaming response
+                        request_id = record.get("request_id")
+                        if not request_id:
+                            continue
+                        state = states_get(request_id)
+                        if state is None:
+                            state = states[request_id] = _MergeState()
+                        state.response = record
+                        non_streaming_count += 1
+
+                # Emit finished requests from the head of the queue while still
+                # reading, so output is written in request order as input arrives
+                while pending and states[pending[0]].is_complete():
+                    state = states.pop(pending.popleft())
+                    if state.request is not None:
+                        self._collect_request(batch, state.request, state, stats)
+                if len(batch) >= _WRITE_BATCH_SIZE:
+                    writer.write_records(batch)
+                    batch.clear()
+
+            self._logger.info(
+                "Found %d requests, %d chunks, %d non-streaming responses",
+                stats["total_requests"],
+                chunk_count,
+                non_streaming_count,
+            )
+
+            # Whatever is left never saw a response_meta or response record
+            for request_id in pending:
+                state = states[request_id]
+                if state.request is not None:
+                    self._collect_request(batch, state.request, state, stats)
+            if batch:
+                writer.write_records(batch)
+
+    def _collect_request(
+        self,
+        batch: list[dict[str, Any]],
+        request: dict[str, Any],
+        state: _MergeState,
+        stats: dict[str, int],
+    ) -> None:
+        """
+        Append a request and its merged response to the output batch.
+
+        Args:
+            batch: Pending output records, written by the caller in bulk
+            request: The request record
+            state: Accumulated records for the request
+            stats: Statistics dictionary to update in place
+        """
+        request_id = request["id"]
+        batch.append(request)
+
+        # Check if this was a streaming or non-streaming request
+        if state.chunks:
+            # Streaming request - write merged response
+            request_chunks = state.sorted_chunks()
+            meta = state.meta or {}
+
+            # Detect API format and rebuild response
+            api_format = self._detect_api_format(request_chunks, request.get("url"))
+            if api_format == "anthropic":
+                response = self._rebuild_anthropic_response(request_id, request_chunks, meta)
+            else:
+                response = self._rebuild_openai_response(request_id, request_chunks, meta)
+
+            batch.append(response)
+            stats["streaming_requests"] += 1
+            stats["total_chunks_processed"] += len(request_chunks)
+
+        elif state.response is not None:
+            # Non-streaming request - write response as-is
+            batch.append(state.response)
+            stats["non_streaming_requests"] += 1
+
+        else:
+            # Request without response - only the request is written
+            self._logger.warning("Request %s... has no response", request_id[:8])
+            stats["incomplete_requests"] += 1
+
+    def _detect_api_format(self, chunks: list[dict[str, Any]], url: str | None = None) -> str:
         """
         Detect whether chunks are from Anthropic or OpenAI API.
 
+        The request URL is checked first so that chunks from the official
+        endpoints don't need to be inspected. Both the provider's host and the
+        endpoint path must match, since providers also serve each other's
+        formats (e.g. Anthropic's OpenAI-compatible /v1/chat/completions);
+        everything else falls back to inspecting the chunk contents.
+
         Args:
             chunks: List of response chunk records
+            url: Optional URL of the originating request
 
         Returns:
             "anthropic" or "openai"
         """
+        if url:
+            parsed = urlparse(url)
+            host = parsed.hostname or ""
+            path = parsed.path.rstrip("/")
+            if _host_in_domain(host, "anthropic.com") and path.endswith("/v1/messages"):
+                return "anthropic"
+            if _host_in_domain(host, "openai.com") and path.endswith("/chat/completions"):
+                return "openai"
+
         for chunk in chunks:
             content = chunk.get("content", {})
             if not isinstance(content, dict):
@@ -224,7 +388,7 @@ class StreamMerger:
 
         # Track content blocks by index
         content_blocks: dict[int, dict[str, Any]] = {}
-        content_block_deltas: dict[int, list[str]] = defaultdict(list)
+        content_block_deltas: dict[int, list[str]] = {}
 
         # Track status code and timestamp from first chunk
         status_code = meta.get("status_code", 200)
@@ -286,17 +450,19 @@ class StreamMerger:
                 delta_type = delta.get("type", "")
 
                 if delta_type == "text_delta":
-                    text = delta.get("text", "")
-                    if text:
-                        content_block_deltas[index].append(text)
+                    fragment = delta.get("text", "")
                 elif delta_type == "input_json_delta":
-                    partial_json = delta.get("partial_json", "")
-                    if partial_json:
-                        content_block_deltas[index].append(partial_json)
+                    fragment = delta.get("partial_json", "")
                 elif delta_type == "thinking_delta":
-                    thinking = delta.get("thinking", "")
-                    if thinking:
-                        content_block_deltas[index].append(thinking)
+                    fragment = delta.get("thinking", "")
+                else:
+                    fragment = ""
+
+                if fragment:
+                    parts = content_block_deltas.get(index)
+                    if parts is None:
+                        content_block_deltas[index] = parts = []
+                    parts.append(fragment)
 
             elif content_type == "message_delta":
                 # Extract final message metadata
@@ -309,36 +475,31 @@ class StreamMerger:
                 if "usage" in content:
                     body["usage"].update(content["usage"])
 
-        # Merge deltas into content blocks
-        for index, block in sorted(
+        # Merge deltas into content blocks, joining each block's text once
+        ordered_blocks = sorted(
             content_blocks.items(),
             key=lambda x: (0, int(x[0])) if str(x[0]).isdigit() else (1, str(x[0])),
-        ):
-            delta_parts = content_block_deltas.get(index, [])
-            merged_delta = "".join(delta_parts)
+        )
+        for index, block in ordered_blocks:
+            delta_parts = content_block_deltas.get(index)
+            if not delta_parts:
+                continue
 
-            if block.get("type") == "text":
-                block["text"] = block.get("text", "") + merged_delta
-            elif block.get("type") == "tool_use":
+            block_type = block.get("type")
+            if block_type == "text":
+                block["text"] = "".join((block.get("text", ""), *delta_parts))
+            elif block_type == "tool_use":
                 # Parse accumulated JSON for tool input
-                if merged_delta:
-                    try:
-                        block["input"] = json.loads(merged_delta)
-                    except json.JSONDecodeError:
-                        block["input"] = merged_delta
-            elif block.get("type") == "thinking":
-                block["thinking"] = block.get("thinking", "") + merged_delta
+                merged_delta = "".join(delta_parts)
+                try:
+                    block["input"] = orjson.loads(merged_delta)
+                except orjson.JSONDecodeError:
+                    block["input"] = merged_delta
+            elif block_type == "thinking":
+                block["thinking"] = "".join((block.get("thinking", ""), *delta_parts))
 
         # Build content array in order
-        body["content"] = [
-            block
-            for _, block in sorted(
-                content_blocks.items(),
-                key=lambda x: (
-                    (0, int(x[0])) if str(x[0]).isdigit() else (1, str(x[0]))
-                ),
-            )
-        ]
+        body["content"] = [block for _, block in ordered_blocks]
 
         # Build response record
         response: dict[str, Any] = {
@@ -381,9 +542,9 @@ class StreamMerger:
         }
 
         # Track choices by index
-        choices_content: dict[int, list[str]] = defaultdict(list)
-        choices_tool_calls: dict[int, dict[int, dict[str, Any]]] = defaultdict(dict)
-        choices_tool_args: dict[int, dict[int, list[str]]] = defaultdict(lambda: defaultdict(list))
+        choices_content: dict[int, list[str]] = {}
+        choices_tool_calls: dict[int, dict[int, dict[str, Any]]] = {}
+        choices_tool_args: dict[int, dict[int, list[str]]] = {}
         choices_finish_reason: dict[int, str | None] = {}
         choices_role: dict[int, str] = {}
 
@@ -423,15 +584,19 @@ class StreamMerger:
                     choices_role[index] = delta["role"]
 
                 # Accumulate content
-                if "content" in delta and delta["content"]:
-                    choices_content[index].append(delta["content"])
+                delta_content = delta.get("content")
+                if delta_content:
+                    parts = choices_content.get(index)
+                    if parts is None:
+                        choices_content[index] = parts = []
+                    parts.append(delta_content)
 
                 # Accumulate tool calls
                 if "tool_calls" in delta:
                     for tc in delta["tool_calls"]:
                         tc_index = tc.get("index", 0)
                         if "id" in tc:
-                            choices_tool_calls[index][tc_index] = {
+                            choices_tool_calls.setdefault(index, {})[tc_index] = {
                                 "id": tc["id"],
                                 "type": tc.get("type", "function"),
                                 "function": {
@@ -440,7 +605,9 @@ class StreamMerger:
                                 },
                             }
                         if "function" in tc and "arguments" in tc["function"]:
-                            choices_tool_args[index][tc_index].append(tc["function"]["arguments"])
+                            choices_tool_args.setdefault(index, {}).setdefault(tc_index, []).append(
+                                tc["function"]["arguments"]
+                            )
 
                 # Track finish reason
                 if "finish_reason" in choice and choice["finish_reason"]:
@@ -513,21 +680,22 @@ class StreamMerger:
         text_parts: list[str] = []
 
         for chunk in chunks:
-            content = chunk.get("content", {})
+            # Lookups use membership tests or None checks rather than
+            # .get(key, {}), so no throwaway empty dicts are built per chunk
+            content = chunk.get("content")
             if isinstance(content, dict):
                 # Handle different API formats
 
                 # Anthropic format
-                if "delta" in content:
-                    delta = content["delta"]
-                    if isinstance(delta, dict) and "text" in delta:
-                        text_parts.append(delta["text"])
+                delta = content.get("delta")
+                if isinstance(delta, dict) and "text" in delta:
+                    text_parts.append(delta["text"])
 
                 # OpenAI format
                 if "choices" in content:
-                    for choice in content.get("choices", []):
-                        delta = choice.get("delta", {})
-                        if "content" in delta:
+                    for choice in content["choices"]:
+                        delta = choice.get("delta")
+                        if delta is not None and "content" in delta:
                             text_parts.append(delta["content"])
 
                 # Raw text in content
@@ -535,10 +703,9 @@ class StreamMerger:
                     text_parts.append(content["text"])
 
                 # Message content
-                if "content_block" in content:
-                    block = content["content_block"]
-                    if isinstance(block, dict) and "text" in block:
-                        text_parts.append(block["text"])
+                block = content.get("content_block")
+                if isinstance(block, dict) and "text" in block:
+                    text_parts.append(block["text"])
 
             elif isinstance(content, str):
                 text_parts.append(content)
@@ -557,32 +724,35 @@ class StreamMerger:
         """
         # Track tool calls by their content block index
         tool_call_data: dict[int, dict[str, Any]] = {}
-        tool_input_parts: dict[int, list[str]] = defaultdict(list)
+        tool_input_parts: dict[int, list[str]] = {}
 
         for chunk in chunks:
-            content = chunk.get("content", {})
+            content = chunk.get("content")
             if not isinstance(content, dict):
                 continue
 
-            content_type = content.get("type", "")
-            index = content.get("index")
+            content_type = content.get("type")
 
             # Start of a tool_use content block
             if content_type == "content_block_start":
-                block = content.get("content_block", {})
+                block = content.get("content_block")
                 if isinstance(block, dict) and block.get("type") == "tool_use":
-                    tool_call_data[index] = {
+                    tool_call_data[content.get("index")] = {
                         "id": block.get("id", ""),
                         "name": block.get("name", ""),
                     }
 
             # Delta containing input JSON fragments
             elif content_type == "content_block_delta":
-                delta = content.get("delta", {})
+                delta = content.get("delta")
                 if isinstance(delta, dict) and delta.get("type") == "input_json_delta":
-                    partial_json = delta.get("partial_json", "")
+                    partial_json = delta.get("partial_json")
+                    index = content.get("index")
                     if partial_json and index is not None:
-                        tool_input_parts[index].append(partial_json)
+                        parts = tool_input_parts.get(index)
+                        if parts is None:
+                            tool_input_parts[index] = parts = []
+                        parts.append(partial_json)
 
         # Build the final tool calls list
         tool_calls: list[ToolCall] = []
@@ -597,13 +767,13 @@ class StreamMerger:
             tool_input = None
             if full_json_str:
                 try:
-                    tool_input = json.loads(full_json_str)
-                except json.JSONDecodeError:
+                    tool_input = orjson.loads(full_json_str)
+                except orjson.JSONDecodeError:
                     # If parsing fails, keep the raw string
                     tool_input = full_json_str
 
             tool_calls.append(
-                ToolCall(
+                ToolCall.model_construct(
                     id=data["id"],
                     name=data["name"],
                     input=tool_input,
@@ -629,14 +799,14 @@ class StreamMerger:
         # OpenAI format
         if "choices" in body:
             texts = []
-            for choice in body.get("choices", []):
-                message = choice.get("message", {})
-                if "content" in message:
+            for choice in body["choices"]:
+                message = choice.get("message")
+                if message is not None and "content" in message:
                     texts.append(message["content"])
             return "".join(texts)
 
         # Fallback: JSON dump
-        return json.dumps(body)
+        return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS).decode()
 
     def _extract_tool_calls_from_body(self, body: dict[str, Any]) -> list[ToolCall]:
         """Extract tool calls from a non-streaming response body.
@@ -653,7 +823,7 @@ class StreamMerger:
                 for item in content:
                     if isinstance(item, dict) and item.get("type") == "tool_use":
                         tool_calls.append(
-                            ToolCall(
+                            ToolCall.model_construct(
                                 id=item.get("id", ""),
                                 name=item.get("name", ""),
                                 input=item.get("input"),
@@ -667,7 +837,7 @@ class StreamMerger:
                 if "tool_calls" in message:
                     for tc in message.get("tool_calls", []):
                         tool_calls.append(
-                            ToolCall(
+                            ToolCall.model_construct(
                                 id=tc.get("id", ""),
                                 name=tc.get("function", {}).get("name", ""),
                                 input=tc.get("function", {}).get("arguments"),
@@ -676,17 +846,15 @@ class StreamMerger:
 
         return tool_calls
 
-    def _parse_timestamp(self, ts: Any) -> datetime:
+    @staticmethod
+    def _parse_timestamp(ts: Any) -> datetime:
         """Parse a timestamp from various formats."""
         if isinstance(ts, datetime):
             return ts
         if isinstance(ts, str):
-            # Handle ISO format with Z suffix
-            ts = ts.rstrip("Z")
-            try:
-                return datetime.fromisoformat(ts)
-            except ValueError:
-                pass
+            parsed = _parse_iso_timestamp(ts)
+            if parsed is not None:
+                return parsed
         return datetime.utcnow()
 
 
@@ -8,6 +8,7 @@ like 0.0.0.0 / :: (similar to how FastAPI prints a reachable LAN URL).
 
 from __future__ import annotations
 
+import functools
 import ipaddress
 import socket
 
@@ -28,12 +29,16 @@ def _is_publicly_unhelpful(ip: str) -> bool:
     )
 
 
+@functools.lru_cache(maxsize=1)
 def detect_primary_ipv4() -> str | None:
     """
     Best-effort detection of the primary LAN IPv4 address.
 
     Uses a UDP "connect" trick which does not require external connectivity and
     does not send packets, but selects the outbound interface/address.
+
+    The result is cached for the lifetime of the process; call
+    ``detect_primary_ipv4.cache_clear()`` to force a new probe.
     """
     # 1) UDP connect trick (most reliable for "default route")
     try:
@@ -6,16 +6,19 @@ Handles traffic interception, data capture, and sensitive data masking.
 
 from __future__ import annotations
 
-import json
+import asyncio
+import itertools
 import logging
 import re
+import secrets
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
 from datetime import datetime, timezone
+from functools import partial
 from io import StringIO
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
-from uuid import uuid4
 
 from mitmproxy import http
 from mitmproxy.options import Options
@@ -30,10 +33,54 @@ from lli.logger import (
     log_streaming_progress,
     log_tls_handshake_failure,
 )
+from lli.storage import loads_json
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator, Mapping
+
     from lli.watch import WatchManager
 
+# Pre-compiled regex patterns for API key masking. They are applied in turn,
+# each only when a cheap substring/length check shows it could match; a single
+# combined alternation is not equivalent, since a long-token match can swallow
+# the start of a following "sk-" key or "Bearer" token and leave it unmasked
+_SK_KEY_RE = re.compile(r"(sk-[a-zA-Z0-9]{4})[a-zA-Z0-9]+")
+_BEARER_RE = re.compile(r"(Bearer\s+)[a-zA-Z0-9_-]+")
+_LONG_KEY_RE = re.compile(r"([a-zA-Z0-9]{8})[a-zA-Z0-9]{24,}")
+
+
+# Request IDs only need to be unique within a capture, so they are built from a
+# per-process counter and a random suffix drawn once at import instead of a
+# uuid4() (an os.urandom call) per flow; the counter comes first so the short
+# "abcd1234..." form used in log messages still tells requests apart
+_REQUEST_ID_SUFFIX = secrets.token_hex(4)
+_REQUEST_ID_SEQ = itertools.count()
+
+
+def _new_request_id() -> str:
+    """Return a new process-unique request ID."""
+    return f"{next(_REQUEST_ID_SEQ):08x}-{_REQUEST_ID_SUFFIX}"
+
+
+# Keys under which per-flow capture state is kept in flow.metadata
+_META_REQUEST_ID = "lli_request_id"
+_META_START_TIME = "lli_start_time"
+_META_SESSION_ID = "lli_session_id"
+_META_CAPTURE = "lli_capture"
+
+# Media type of streaming (server-sent events) responses; parameters such as
+# "; charset=utf-8" may follow it
+_SSE_CONTENT_TYPE = "text/event-stream"
+
+# Number of SSE chunk records handed to the watch manager per write
+_CHUNK_WRITE_BATCH_SIZE = 256
+
+# Response bodies larger than this are parsed off the event loop
+_OFFLOAD_BODY_SIZE = 64 * 1024
+
+# "data:" and "event:" fields of a server-sent events body, one per line
+_SSE_FIELD_RE = re.compile(rb"^(data|event):(.*)$", re.MULTILINE)
+
 
 class WatchAddon:
     """
@@ -63,10 +110,20 @@ class WatchAddon:
         self.masking_config = config.masking
         self._logger = get_logger()
 
-        # Track in-flight requests
-        self._request_times: dict[int, float] = {}
-        self._request_ids: dict[int, str] = {}
-        self._request_sessions: dict[int, str | None] = {}
+        # Masking settings looked up for every captured flow; the *_enabled
+        # flags let request()/response() skip the masking calls entirely
+        self._mask_headers_enabled = self.masking_config.mask_auth_headers and bool(
+            self.masking_config.sensitive_headers
+        )
+        self._sensitive_headers = frozenset(self.masking_config.sensitive_headers)
+        self._mask_pattern = self.masking_config.mask_pattern
+        self._mask_paths = tuple(
+            tuple(field_path.split(".")) for field_path in self.masking_config.sensitive_body_fields
+        )
+        self._mask_body_enabled = bool(self._mask_paths)
+
+        # Worker threads for parsing and writing streamed or large responses
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lli-response")
 
     def request(self, flow: http.HTTPFlow) -> None:
         """Handle an outgoing request."""
@@ -81,11 +138,13 @@ class WatchAddon:
         # Log summary for all requests
         log_request_summary(method, url, captured=should_capture)
 
-        # Generate unique request ID and track timing for all requests
-        request_id = str(uuid4())
-        flow_id = id(flow)
-        self._request_ids[flow_id] = request_id
-        self._request_times[flow_id] = time.time()
+        # Generate unique request ID and track timing for all requests; the
+        # flow carries them to response() and is released by mitmproxy when done
+        request_id = _new_request_id()
+        start_time = time.time()
+        flow.metadata[_META_REQUEST_ID] = request_id
+        flow.metadata[_META_START_TIME] = start_time
+        flow.metadata[_META_CAPTURE] = should_capture
 
         if not should_capture:
             self._logger.debug("URL not matched, skipping: %s", url)
@@ -93,23 +152,26 @@ class WatchAddon:
 
         # Capture current session ID for this request
         session_id = self.watch_manager.current_session_id
-        self._request_sessions[flow_id] = session_id
+        flow.metadata[_META_SESSION_ID] = session_id
 
         # Parse headers (with masking)
-        headers = self._mask_headers(dict(flow.request.headers))
+        if self._mask_headers_enabled:
+            headers = self._mask_headers(flow.request.headers)
+        else:
+            headers = dict(flow.request.headers)
 
         # Parse body
         body = self._parse_body(flow.request.content, flow.request.headers.get("content-type"))
 
         # Mask sensitive body fields if configured
-        if body and isinstance(body, dict):
+        if self._mask_body_enabled and body and isinstance(body, dict):
             body = self._mask_body_fields(body)
 
         # Create request record
         record = {
             "type": "request",
             "id": request_id,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(start_time, timezone.utc).isoformat(),
             "method": method,
             "url": url,
             "headers": headers,
@@ -119,19 +181,21 @@ class WatchAddon:
         self.watch_manager.write_record(record, session_id=session_id)
         self._logger.debug("Captured request %s to %s", request_id[:8], url)
 
-    def response(self, flow: http.HTTPFlow) -> None:
+    async def response(self, flow: http.HTTPFlow) -> None:
         """Handle a response."""
         url = flow.request.pretty_url
         method = flow.request.method
         status_code = flow.response.status_code
 
-        # Determine if we should capture this response
-        should_capture = self.url_filter.should_capture(url)
+        metadata = flow.metadata
 
-        flow_id = id(flow)
-        request_id = self._request_ids.get(flow_id, str(uuid4()))
-        start_time = self._request_times.get(flow_id, time.time())
-        latency_ms = (time.time() - start_time) * 1000
+        # Determine if we should capture this response
+        should_capture = self._should_capture(flow, url)
+        # Popped so that error() knows this flow already has its response record
+        request_id = metadata.pop(_META_REQUEST_ID, None) or _new_request_id()
+        now = time.time()
+        start_time = metadata.get(_META_START_TIME, now)
+        latency_ms = (now - start_time) * 1000
 
         # Log summary for all responses
         log_request_summary(
@@ -143,16 +207,14 @@ class WatchAddon:
         )
 
         if not should_capture:
-            # Cleanup and exit early if not capturing
-            self._cleanup_flow(flow_id)
             return
 
         # Use the session ID from the request start
-        session_id = self._request_sessions.get(flow_id)
+        session_id = metadata.get(_META_SESSION_ID)
 
         # Check if this is a streaming response
         content_type = flow.response.headers.get("content-type", "")
-        is_streaming = "text/event-stream" in content_type
+        is_streaming = content_type.startswith(_SSE_CONTENT_TYPE)
 
         self._logger.debug(
             "Response received: %s %s (streaming=%s, content-type=%s)",
@@ -162,63 +224,54 @@ class WatchAddon:
             content_type,
         )
 
+        content = flow.response.content
+        args = (request_id, session_id, status_code, content, now, latency_ms)
         if is_streaming:
-            # For streaming SSE responses, parse the complete body into chunks
-            sse_events = self._parse_sse_body(flow.response.content)
-
-            # Write individual chunk records for each SSE event
-            for chunk_index, event_content in enumerate(sse_events):
-                chunk_record = {
-                    "type": "response_chunk",
-                    "request_id": request_id,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "status_code": status_code,
-                    "chunk_index": chunk_index,
-                    "content": event_content,
-                }
-                self.watch_manager.write_record(chunk_record, session_id=session_id)
-                log_streaming_progress(request_id, chunk_index)
-
-            # Write meta record with chunk count
-            meta_record = {
-                "type": "response_meta",
-                "request_id": request_id,
-                "total_latency_ms": latency_ms,
-                "status_code": status_code,
-                "total_chunks": len(sse_events),
-            }
-            self.watch_manager.write_record(meta_record, session_id=session_id)
+            process = partial(self._write_streaming_response, *args)
         else:
-            # Non-streaming response - capture complete body
-            headers = self._mask_headers(dict(flow.response.headers))
-            body = self._parse_body(
-                flow.response.content, flow.response.headers.get("content-type")
-            )
-
-            record = {
-                "type": "response",
-                "request_id": request_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "status_code": status_code,
-                "headers": headers,
-                "body": body,
-                "latency_ms": latency_ms,
-            }
-            self.watch_manager.write_record(record, session_id=session_id)
+            process = partial(self._write_response, *args, flow.response.headers, content_type)
 
-        # Cleanup
-        self._cleanup_flow(flow_id)
+        # Parsing a streamed or large body can take a while, so do it on a
+        # worker thread and keep the event loop free for other flows
+        if is_streaming or (content is not None and len(content) > _OFFLOAD_BODY_SIZE):
+            await asyncio.get_running_loop().run_in_executor(self._executor, process)
+        else:
+            process()
 
     def responseheaders(self, flow: http.HTTPFlow) -> None:
         """Handle response headers (called before body is received)."""
         url = flow.request.pretty_url
-        if not self.url_filter.should_capture(url):
+        if not self._should_capture(flow, url):
             return
 
         content_type = flow.response.headers.get("content-type", "")
-        if "text/event-stream" in content_type:
+        if content_type.startswith(_SSE_CONTENT_TYPE):
             self._logger.debug("Detected streaming response for %s", url)
 
+    def error(self, flow: http.HTTPFlow) -> None:
+        """Close off a captured request whose flow failed before response() ran."""
+        request_id = flow.metadata.pop(_META_REQUEST_ID, None)
+        if request_id is None or not flow.metadata.get(_META_CAPTURE):
+            return
+
+        # Without a terminal record the merger would hold this request, and
+        # every request captured after it, until the end of the input
+        start_time = flow.metadata.get(_META_START_TIME, time.time())
+        meta_record = {
+            "type": "response_meta",
+            "request_id": request_id,
+            "total_latency_ms": (time.time() - start_time) * 1000,
+            "status_code": flow.response.status_code if flow.response else None,
+            "total_chunks": 0,
+            "error": flow.error.msg if flow.error else None,
+        }
+        self.watch_manager.write_record(meta_record, session_id=flow.metadata.get(_META_SESSION_ID))
+        self._logger.debug("Request %s failed: %s", request_id[:8], meta_record["error"])
+
+    def done(self) -> None:
+        """Wait for in-flight response writes when mitmproxy shuts down."""
+        self._executor.shutdown(wait=True)
+
     def tls_failed_server(self, data: TlsData) -> None:
         """Log TLS handshake failures with server context."""
         server = data.conn
@@ -233,41 +286,124 @@ class WatchAddon:
             target = "unknown"
         log_tls_handshake_failure(target, getattr(server, "error", None))
 
-    def _parse_sse_body(self, content: bytes | None) -> list[Any]:
-        """Parse a complete SSE response body into individual events."""
-        if not content:
-            return []
+    def _should_capture(self, flow: http.HTTPFlow, url: str) -> bool:
+        """Return the capture decision made in request(), or evaluate the filter."""
+        should_capture = flow.metadata.get(_META_CAPTURE)
+        if should_capture is None:
+            should_capture = self.url_filter.should_capture(url)
+            flow.metadata[_META_CAPTURE] = should_capture
+        return should_capture
 
-        events = []
-        try:
-            text = content.decode("utf-8")
-            raw_events = text.split("\n\n")
+    def _write_streaming_response(
+        self,
+        request_id: str,
+        session_id: str | None,
+        status_code: int,
+        content: bytes | None,
+        now: float,
+        latency_ms: float,
+    ) -> None:
+        """Write a chunk record per SSE event of a streaming response, then its meta record."""
+        # All chunks share the response timestamp and are written in batches
+        timestamp = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        chunk_count = 0
+        batch: list[dict[str, Any]] = []
+        for event_content in self._iter_sse_events(content):
+            chunk_record = {
+                "type": "response_chunk",
+                "request_id": request_id,
+                "timestamp": timestamp,
+                "status_code": status_code,
+                "chunk_index": chunk_count,
+                "content": event_content,
+            }
+            batch.append(chunk_record)
+            log_streaming_progress(request_id, chunk_count)
+            chunk_count += 1
+            if len(batch) >= _CHUNK_WRITE_BATCH_SIZE:
+                self.watch_manager.write_records(batch, session_id=session_id)
+                batch = []
+
+        # Write meta record with chunk count
+        meta_record = {
+            "type": "response_meta",
+            "request_id": request_id,
+            "total_latency_ms": latency_ms,
+            "status_code": status_code,
+            "total_chunks": chunk_count,
+        }
+        batch.append(meta_record)
+        self.watch_manager.write_records(batch, session_id=session_id)
 
-            for raw_event in raw_events:
-                raw_event = raw_event.strip()
-                if not raw_event:
-                    continue
+    def _write_response(
+        self,
+        request_id: str,
+        session_id: str | None,
+        status_code: int,
+        content: bytes | None,
+        now: float,
+        latency_ms: float,
+        headers: Mapping[str, str],
+        content_type: str,
+    ) -> None:
+        """Write the record for a non-streaming response with its complete body."""
+        if self._mask_headers_enabled:
+            masked_headers = self._mask_headers(headers)
+        else:
+            masked_headers = dict(headers)
+        body = self._parse_body(content, content_type)
 
-                for line in raw_event.split("\n"):
-                    if line.startswith("data:"):
-                        data = line[5:].strip()
-                        if data == "[DONE]":
-                            events.append({"done": True})
-                        else:
-                            try:
-                                events.append(json.loads(data))
-                            except json.JSONDecodeError:
-                                events.append({"raw": data})
-                    elif line.startswith("event:"):
-                        event_type = line[6:].strip()
-                        if events and isinstance(events[-1], dict):
-                            events[-1]["_event_type"] = event_type
-
-            return events
+        record = {
+            "type": "response",
+            "request_id": request_id,
+            "timestamp": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            "status_code": status_code,
+            "headers": masked_headers,
+            "body": body,
+            "latency_ms": latency_ms,
+        }
+        self.watch_manager.write_record(record, session_id=session_id)
+
+    def _iter_sse_events(self, content: bytes | None) -> Iterator[Any]:
+        """
+        Parse a complete SSE response body, yielding events one at a time.
+
+        An "event:" field tags the event parsed before it, so each event is
+        held back until the next data field (or the end of the body).
+        """
+        if not content:
+            return
+
+        previous: Any = None
+        has_previous = False
+        try:
+            # Single pass over the raw bytes; only field values are decoded
+            for match in _SSE_FIELD_RE.finditer(content):
+                field, value = match.groups()
+                if field == b"data":
+                    data = value.strip()
+                    if data == b"[DONE]":
+                        event: Any = {"done": True}
+                    else:
+                        try:
+                            event = loads_json(data)
+                        except ValueError:
+                            event = {"raw": data.decode("utf-8")}
+                    if has_previous:
+                        yield previous
+                    previous, has_previous = event, True
+                elif has_previous and isinstance(previous, dict):
+                    previous["_event_type"] = value.strip().decode("utf-8")
 
         except Exception as e:
             self._logger.debug("Failed to parse SSE body: %s", e)
-            return [{"error": str(e), "raw": content[:500].hex() if content else ""}]
+            if has_previous:
+                yield previous
+            yield {"error": str(e), "raw": content[:500].hex()}
+            return
+
+        if has_previous:
+            yield previous
 
     def _parse_body(self, content: bytes | None, content_type: str | None) -> Any:
         """Parse request/response body based on content type."""
@@ -275,15 +411,16 @@ class WatchAddon:
             return None
 
         try:
+            # JSON is parsed from the raw bytes, so bodies are never decoded to str
             if content_type and "json" in content_type:
-                return json.loads(content.decode("utf-8"))
+                return loads_json(content)
 
             try:
-                text = content.decode("utf-8")
-                try:
-                    return json.loads(text)
-                except json.JSONDecodeError:
-                    return text
+                return loads_json(content)
+            except ValueError:
+                pass
+            try:
+                return content.decode("utf-8")
             except UnicodeDecodeError:
                 return f"<binary content: {len(content)} bytes>"
 
@@ -291,71 +428,63 @@ class WatchAddon:
             self._logger.debug("Failed to parse body: %s", e)
             return f"<parse error: {e}>"
 
-    def _mask_headers(self, headers: dict[str, str]) -> dict[str, str]:
-        """Mask sensitive headers."""
-        if not self.masking_config.mask_auth_headers:
-            return headers
-
-        masked = {}
-        for key, value in headers.items():
-            key_lower = key.lower()
-            if key_lower in self.masking_config.sensitive_headers:
-                masked[key] = self._mask_api_key(value)
-            else:
-                masked[key] = value
-
-        return masked
+    def _mask_headers(self, headers: Mapping[str, str]) -> dict[str, str]:
+        """
+        Copy headers (e.g. a mitmproxy Headers object) into a dict, masking sensitive ones.
 
-    # Pre-compiled regex patterns for API key masking
-    _MASK_PATTERNS = [
-        (re.compile(r"(sk-[a-zA-Z0-9]{4})[a-zA-Z0-9]+"), r"\1***"),
-        (re.compile(r"(Bearer\s+)[a-zA-Z0-9_-]+"), r"\1***MASKED***"),
-        (re.compile(r"([a-zA-Z0-9]{8})[a-zA-Z0-9]{24,}"), r"\1***"),
-    ]
+        Callers skip this when _mask_headers_enabled is False.
+        """
+        sensitive_headers = self._sensitive_headers
+        return {
+            key: self._mask_api_key(value) if key.lower() in sensitive_headers else value
+            for key, value in headers.items()
+        }
 
     def _mask_api_key(self, value: str) -> str:
         """Mask an API key value."""
         masked = value
-        for pattern, replacement in self._MASK_PATTERNS:
-            masked = pattern.sub(replacement, masked)
+        if "sk-" in masked:
+            masked = _SK_KEY_RE.sub(r"\1***", masked)
+        if "Bearer" in masked:
+            masked = _BEARER_RE.sub(r"\1***MASKED***", masked)
+        if len(masked) >= 32:
+            masked = _LONG_KEY_RE.sub(r"\1***", masked)
 
         if masked == value and len(value) > 16:
-            return value[:8] + self.masking_config.mask_pattern
+            return value[:8] + self._mask_pattern
 
         return masked
 
     def _mask_body_fields(self, body: dict[str, Any]) -> dict[str, Any]:
-        """Mask sensitive fields in the request/response body."""
-        if not self.masking_config.sensitive_body_fields:
-            return body
+        """
+        Mask sensitive fields in the request/response body.
 
-        masked = body.copy()
-        for field_path in self.masking_config.sensitive_body_fields:
-            parts = field_path.split(".")
-            self._mask_nested_field(masked, parts)
+        The body is only copied when a configured field is actually present;
+        dicts along the path to a masked field are copied before writing.
+        """
+        masked = body
+        for *parents, leaf in self._mask_paths:
+            # Walk down to the dict holding the field, if the whole path exists
+            obj = masked
+            for key in parents:
+                child = obj.get(key)
+                if not isinstance(child, dict):
+                    break
+                obj = child
+            else:
+                if leaf not in obj:
+                    continue
+                if masked is body:
+                    masked = body.copy()
+                obj = masked
+                for key in parents:
+                    child = obj[key].copy()
+                    obj[key] = child
+                    obj = child
+                obj[leaf] = self._mask_pattern
 
         return masked
 
-    def _mask_nested_field(self, obj: dict[str, Any], path: list[str]) -> None:
-        """Recursively mask a nested field."""
-        if not path:
-            return
-
-        key = path[0]
-        if key not in obj:
-            return
-
-        if len(path) == 1:
-            obj[key] = self.masking_config.mask_pattern
-        elif isinstance(obj[key], dict):
-            self._mask_nested_field(obj[key], path[1:])
-
-    def _cleanup_flow(self, flow_id: int) -> None:
-        """Clean up tracking data for a completed flow."""
-        self._request_times.pop(flow_id, None)
-        self._request_ids.pop(flow_id, None)
-        self._request_sessions.pop(flow_id, None)
-
 
 async def run_watch_proxy(
     config: LLIConfig,
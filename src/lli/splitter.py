@@ -4,14 +4,61 @@ Record splitter utility for LLM Interceptor.
 Splits merged JSONL files into individual JSON files (request and response).
 """
 
+import functools
 import json
+import os
+import re
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+import orjson
+
 from lli.logger import get_logger
 from lli.storage import read_jsonl
 
+# Threads writing output files; file writes release the GIL, so they overlap
+# with reading and encoding the next records
+_WRITE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Upper bound on records queued for writing at any time
+_MAX_PENDING_WRITES = _WRITE_WORKERS * 4
+
+# Full ISO timestamps whose first 19 characters are the date and time of day
+_ISO_TIMESTAMP_RE = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?"
+)
+
+# Turns "2025-11-26T14:12:47" into "2025-11-26_14-12-47"
+_FILENAME_TIMESTAMP_TABLE = str.maketrans({"T": "_", " ": "_", ":": "-"})
+
+
+@functools.lru_cache(maxsize=4096)
+def _iso_to_filename(timestamp: str) -> str | None:
+    """
+    Format an ISO timestamp string for use in a filename.
+
+    Records of one run often share timestamps, so results are cached.
+    Returns None if the string is not a valid ISO timestamp.
+    """
+    # The common "YYYY-MM-DDTHH:MM:SS[.ffffff][Z|+HH:MM]" shape maps onto the
+    # filename format character for character, so skip the datetime round trip
+    if _ISO_TIMESTAMP_RE.fullmatch(timestamp):
+        return timestamp[:19].translate(_FILENAME_TIMESTAMP_TABLE)
+
+    # Parse any other ISO format timestamp
+    ts = timestamp.rstrip("Z").replace("+00:00", "")
+    # Remove any trailing Z after timezone removal
+    if ts.endswith("Z"):
+        ts = ts[:-1]
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        return None
+    return dt.strftime("%Y-%m-%d_%H-%M-%S")
+
 
 class RecordSplitter:
     """
@@ -45,13 +92,12 @@ class RecordSplitter:
             Statistics about the split operation
         """
         self._logger.info("Reading records from %s", self.input_path)
-        records = list(read_jsonl(self.input_path))
 
         # Create output directory if it doesn't exist
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
         stats = {
-            "total_records": len(records),
+            "total_records": 0,
             "request_files": 0,
             "response_files": 0,
             "errors": 0,
@@ -60,27 +106,31 @@ class RecordSplitter:
         # Track pair index for naming
         pair_index = 0
 
-        for record in records:
-            record_type = record.get("type", "")
+        # Filenames are assigned in input order here, while encoding and
+        # writing the files overlaps on worker threads. At most
+        # _MAX_PENDING_WRITES records are in flight, so memory stays bounded.
+        pending: dict[Future[None], tuple[str, str]] = {}
+        with ThreadPoolExecutor(max_workers=_WRITE_WORKERS) as pool:
+            # Records are streamed one at a time rather than loaded up front
+            for record in read_jsonl(self.input_path):
+                stats["total_records"] += 1
+                record_type = record.get("type", "")
 
-            try:
                 if record_type == "request":
                     pair_index += 1
-                    filename = self._generate_filename(pair_index, "request", record)
-                    self._write_json_file(filename, record)
-                    stats["request_files"] += 1
-                    self._logger.debug("Created %s", filename)
-
-                elif record_type == "response":
-                    # Response uses the same pair_index as its corresponding request
-                    filename = self._generate_filename(pair_index, "response", record)
-                    self._write_json_file(filename, record)
-                    stats["response_files"] += 1
-                    self._logger.debug("Created %s", filename)
+                elif record_type != "response":
+                    continue
 
-            except Exception as e:
-                self._logger.error("Error processing record: %s", e)
-                stats["errors"] += 1
+                # Response uses the same pair_index as its corresponding request
+                filename = self._generate_filename(pair_index, record_type, record)
+                future = pool.submit(self._write_json_file, filename, record)
+                pending[future] = (record_type, filename)
+
+                if len(pending) >= _MAX_PENDING_WRITES:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect_writes(done, pending, stats)
+
+            self._collect_writes(list(pending), pending, stats)
 
         self._logger.info(
             "Split complete: %d request files, %d response files created in %s",
@@ -91,6 +141,25 @@ class RecordSplitter:
 
         return stats
 
+    def _collect_writes(
+        self,
+        futures: Iterable[Future[None]],
+        pending: dict[Future[None], tuple[str, str]],
+        stats: dict[str, int],
+    ) -> None:
+        """Remove finished file writes from pending and add them to the statistics."""
+        for future in futures:
+            record_type, filename = pending.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                self._logger.error("Error processing record: %s", e)
+                stats["errors"] += 1
+                continue
+
+            stats[f"{record_type}_files"] += 1
+            self._logger.debug("Created %s", filename)
+
     def _generate_filename(self, index: int, record_type: str, record: dict[str, Any]) -> str:
         """
         Generate filename for a record.
@@ -106,16 +175,9 @@ class RecordSplitter:
     def _format_timestamp_for_filename(self, timestamp: Any) -> str:
         """Format timestamp for use in filename."""
         if isinstance(timestamp, str):
-            # Parse ISO format timestamp
-            ts = timestamp.rstrip("Z").replace("+00:00", "")
-            # Remove any trailing Z after timezone removal
-            if ts.endswith("Z"):
-                ts = ts[:-1]
-            try:
-                dt = datetime.fromisoformat(ts)
-                return dt.strftime("%Y-%m-%d_%H-%M-%S")
-            except ValueError:
-                pass
+            ts_str = _iso_to_filename(timestamp)
+            if ts_str is not None:
+                return ts_str
 
         if isinstance(timestamp, datetime):
             return timestamp.strftime("%Y-%m-%d_%H-%M-%S")
@@ -132,8 +194,14 @@ class RecordSplitter:
             record: The record data to write
         """
         output_path = self.output_dir / filename
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, indent=2, ensure_ascii=False)
+        try:
+            data = orjson.dumps(record, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            # orjson.JSONEncodeError (a TypeError) for integers wider than 64 bits
+            data = json.dumps(record, indent=2, ensure_ascii=False).encode("utf-8")
+        # orjson emits UTF-8 bytes directly, so the file is written in binary mode
+        with open(output_path, "wb") as f:
+            f.write(data)
 
 
 def split_records(input_path: str | Path, output_dir: str | Path) -> dict[str, int]:
@@ -5,15 +5,84 @@ Handles writing request/response records to JSONL files.
 """
 
 import json
+import re
 import threading
+from collections.abc import Iterable, Iterator
 from datetime import datetime
 from pathlib import Path
-from typing import Any, TextIO
+from typing import Any, BinaryIO
 
+import orjson
 from pydantic import BaseModel
 
 from lli.logger import get_logger
 
+# Read buffer used when streaming JSONL files
+READ_BUFFER_SIZE = 1 << 20
+
+# Leading "type" field as written by our own writers (optionally after _session_id),
+# which lets count_records classify a line without parsing it
+_LEADING_TYPE_RE = re.compile(rb'\{(?:"_session_id":(?:null|"[^"\\]*"),)?"type":"([^"\\]*)"')
+
+# orjson parses integers outside the signed/unsigned 64-bit range as floats;
+# lines with a run of this many digits are parsed by json to keep them exact
+_LONG_DIGITS_RE = re.compile(rb"\d{19}")
+
+
+def loads_json(data: bytes) -> Any:
+    """
+    Parse JSON bytes with orjson, falling back to json where orjson would lose data.
+
+    orjson turns integers wider than 64 bits into floats and rejects NaN,
+    Infinity and lone surrogates, all of which json accepts.
+
+    Raises:
+        ValueError: If the data is not valid JSON
+    """
+    if _LONG_DIGITS_RE.search(data):
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+def _json_default(obj: Any) -> Any:
+    """Serialize values orjson passes through (datetimes) to ISO format strings."""
+    if isinstance(obj, datetime):
+        return obj.isoformat() + "Z" if obj.tzinfo is None else obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_json_line(data: Any, pretty: bool = False) -> bytes:
+    """
+    Serialize a record to a newline-terminated JSON line.
+
+    Records orjson cannot encode (integers wider than 64 bits, lone
+    surrogates) are written with json instead.
+
+    Args:
+        data: Record to serialize
+        pretty: Indent the JSON with two spaces
+    """
+    # Datetimes are handed to _json_default rather than copying the record
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATETIME
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+
+    try:
+        return orjson.dumps(data, default=_json_default, option=option)
+    except TypeError:
+        # orjson.JSONEncodeError is a TypeError; json escapes non-ASCII text so
+        # that lone surrogates can still be encoded
+        text = json.dumps(
+            data,
+            default=_json_default,
+            indent=2 if pretty else None,
+            separators=(",", ": " if pretty else ":"),
+        )
+        return text.encode("utf-8") + b"\n"
+
 
 class JSONLWriter:
     """
@@ -28,6 +97,8 @@ class JSONLWriter:
         pretty: bool = False,
         max_size_mb: int = 0,
         append: bool = True,
+        buffer_size: int = -1,
+        ensure_parent: bool = True,
     ):
         """
         Initialize the JSONL writer.
@@ -37,23 +108,27 @@ class JSONLWriter:
             pretty: If True, write pretty-printed JSON (one record per multiple lines)
             max_size_mb: Maximum file size in MB before rotation (0 = no rotation)
             append: If True, append to existing file; if False, overwrite
+            buffer_size: File buffer size in bytes (-1 = platform default)
+            ensure_parent: If True, create the parent directory if missing; pass
+                False when the caller has already created it
         """
         self.output_path = Path(output_path)
         self.pretty = pretty
         self.max_size_mb = max_size_mb
         self.append = append
+        self.buffer_size = buffer_size
         self._lock = threading.Lock()
-        self._file: TextIO | None = None
+        self._file: BinaryIO | None = None
         self._record_count = 0
         self._logger = get_logger()
 
         # Ensure parent directory exists
-        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        if ensure_parent:
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
 
     def __enter__(self) -> "JSONLWriter":
         """Open the file for writing."""
-        mode = "a" if self.append else "w"
-        self._file = open(self.output_path, mode, encoding="utf-8")
+        self.open()
         return self
 
     def __exit__(self, *args: object) -> None:
@@ -65,8 +140,8 @@ class JSONLWriter:
     def open(self) -> None:
         """Open the file for writing."""
         if self._file is None:
-            mode = "a" if self.append else "w"
-            self._file = open(self.output_path, mode, encoding="utf-8")
+            mode = "ab" if self.append else "wb"
+            self._file = open(self.output_path, mode, buffering=self.buffer_size)
 
     def close(self) -> None:
         """Close the file."""
@@ -89,36 +164,49 @@ class JSONLWriter:
             if self.max_size_mb > 0:
                 self._check_rotation()
 
-            # Convert to dict if Pydantic model
-            if isinstance(record, BaseModel):
-                data = record.model_dump(mode="json")
-            else:
-                data = record
+            self._file.write(self._encode(record))
+            self._file.flush()
+            self._record_count += 1
 
-            # Convert datetime objects to ISO format
-            data = self._serialize_datetimes(data)
+            self._logger.debug(f"Wrote record #{self._record_count} to {self.output_path}")
 
-            # Write as JSON line
-            if self.pretty:
-                json_str = json.dumps(data, ensure_ascii=False, indent=2)
-            else:
-                json_str = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    def write_records(self, records: Iterable[BaseModel | dict[str, Any]]) -> None:
+        """
+        Write a batch of records to the JSONL file.
+
+        The batch is serialized up front and handed to the file in a single
+        writelines call followed by one flush, instead of one write and
+        flush per record.
+
+        Args:
+            records: Pydantic models or dictionaries to write
+        """
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Writer not opened. Use 'with' context or call open()")
+
+            # Check for file rotation
+            if self.max_size_mb > 0:
+                self._check_rotation()
 
-            self._file.write(json_str + "\n")
+            lines = [self._encode(record) for record in records]
+            self._file.writelines(lines)
             self._file.flush()
-            self._record_count += 1
+            self._record_count += len(lines)
 
-            self._logger.debug(f"Wrote record #{self._record_count} to {self.output_path}")
+            self._logger.debug(
+                f"Wrote {len(lines)} records (total {self._record_count}) to {self.output_path}"
+            )
+
+    def _encode(self, record: BaseModel | dict[str, Any]) -> bytes:
+        """Serialize a record to a newline-terminated JSON line."""
+        # Convert to dict if Pydantic model; plain dicts are serialized as-is
+        if isinstance(record, BaseModel):
+            data = record.model_dump(mode="json")
+        else:
+            data = record
 
-    def _serialize_datetimes(self, obj: Any) -> Any:
-        """Recursively serialize datetime objects to ISO format strings."""
-        if isinstance(obj, datetime):
-            return obj.isoformat() + "Z" if obj.tzinfo is None else obj.isoformat()
-        elif isinstance(obj, dict):
-            return {k: self._serialize_datetimes(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._serialize_datetimes(item) for item in obj]
-        return obj
+        return dumps_json_line(data, pretty=self.pretty)
 
     def _check_rotation(self) -> None:
         """Check if file rotation is needed and perform if necessary."""
@@ -142,7 +230,7 @@ class JSONLWriter:
         self._logger.info(f"Rotated log file to {rotated_path}")
 
         # Open new file
-        self._file = open(self.output_path, "a", encoding="utf-8")
+        self._file = open(self.output_path, "ab", buffering=self.buffer_size)
 
     @property
     def record_count(self) -> int:
@@ -150,27 +238,30 @@ class JSONLWriter:
         return self._record_count
 
 
-def read_jsonl(file_path: str | Path) -> list[dict[str, Any]]:
+def read_jsonl(file_path: str | Path) -> Iterator[dict[str, Any]]:
     """
-    Read all records from a JSONL file.
+    Iterate over the records of a JSONL file.
+
+    Lines are read and parsed one at a time, so memory use is bounded by the
+    largest record rather than the size of the file.
 
     Args:
         file_path: Path to the JSONL file
 
-    Returns:
-        List of dictionaries representing each record
+    Yields:
+        Dictionaries representing each record
     """
-    records: list[dict[str, Any]] = []
-    with open(file_path, encoding="utf-8") as f:
+    with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as f:
         for line_num, line in enumerate(f, 1):
-            line = line.strip()
-            if not line:
+            # orjson accepts the raw bytes with their trailing newline as-is
+            if line.isspace():
                 continue
             try:
-                records.append(json.loads(line))
-            except json.JSONDecodeError as e:
+                record = loads_json(line)
+            except ValueError as e:
                 get_logger().warning(f"Skipping invalid JSON at line {line_num}: {e}")
-    return records
+                continue
+            yield record
 
 
 def count_records(file_path: str | Path) -> dict[str, int]:
@@ -184,7 +275,22 @@ def count_records(file_path: str | Path) -> dict[str, int]:
         Dictionary with counts by record type
     """
     counts: dict[str, int] = {}
-    for record in read_jsonl(file_path):
-        record_type = record.get("type", "unknown")
-        counts[record_type] = counts.get(record_type, 0) + 1
+    match_type = _LEADING_TYPE_RE.match
+    with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.rstrip()
+            if not line:
+                continue
+            # Fast path: take the type from the line prefix of complete records
+            m = match_type(line)
+            if m is not None and line.endswith(b"}"):
+                record_type = m.group(1).decode()
+            else:
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    get_logger().warning(f"Skipping invalid JSON at line {line_num}: {e}")
+                    continue
+                record_type = record.get("type", "unknown")
+            counts[record_type] = counts.get(record_type, 0) + 1
     return counts
@@ -10,14 +10,16 @@ Provides continuous capture with session management:
 import json
 import tempfile
 import threading
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Any, TextIO
+from typing import Any, BinaryIO
 
 from lli.config import get_default_trace_dir
 from lli.logger import get_logger
+from lli.storage import dumps_json_line
 
 SESSION_METADATA_FILE = "session_meta.json"
 
@@ -71,7 +73,7 @@ class GlobalLogger:
             filepath: Path to the global JSONL log file
         """
         self.filepath = Path(filepath)
-        self._file: TextIO | None = None
+        self._file: BinaryIO | None = None
         self._lock = threading.Lock()
         self._logger = get_logger()
 
@@ -79,9 +81,9 @@ class GlobalLogger:
         self.filepath.parent.mkdir(parents=True, exist_ok=True)
 
     def open(self) -> None:
-        """Open the log file for appending."""
+        """Open the log file for appending (O_APPEND, binary so tell() is a byte offset)."""
         if self._file is None:
-            self._file = open(self.filepath, "a", encoding="utf-8")
+            self._file = open(self.filepath, "ab")
             self._logger.debug("Opened global log: %s", self.filepath)
 
     def close(self) -> None:
@@ -114,8 +116,21 @@ class GlobalLogger:
             if self._file is None:
                 raise RuntimeError("GlobalLogger not opened. Call open() first.")
 
-            json_line = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
-            self._file.write(json_line + "\n")
+            self._file.write(dumps_json_line(data))
+            self._file.flush()
+
+    def write_records(self, records: Iterable[dict[str, Any]]) -> None:
+        """
+        Write a batch of records to the global log with a single write and flush.
+
+        Args:
+            records: Dictionaries to write as JSON lines
+        """
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("GlobalLogger not opened. Call open() first.")
+
+            self._file.write(b"".join(dumps_json_line(data) for data in records))
             self._file.flush()
 
     def get_current_offset(self) -> int:
@@ -281,6 +296,19 @@ class WatchManager:
             session_id: Optional session ID to override the current one.
                       Used for responses to requests that started in a previous session.
         """
+        self.write_records([record], session_id=session_id)
+
+    def write_records(
+        self, records: Iterable[dict[str, Any]], session_id: str | None = None
+    ) -> None:
+        """
+        Write a batch of records to the global log with session ID injection.
+
+        Args:
+            records: Records to write, in order
+            session_id: Optional session ID to override the current one.
+                      Used for responses to requests that started in a previous session.
+        """
         if not self._global_logger:
             raise RuntimeError("WatchManager not initialized. Call initialize() first.")
 
@@ -288,20 +316,20 @@ class WatchManager:
         if session_id is None:
             session_id = self.current_session_id
 
-        # Maintain per-session request count (for watch-mode status output).
-        # Only count actual request records for the currently active recording session.
-        if record.get("type") == "request":
+        batch = [{"_session_id": session_id, **record} for record in records]
+
+        # Maintain per-session request count (for watch-mode status output)
+        request_count = sum(1 for record in batch if record.get("type") == "request")
+        if request_count:
             with self._state_lock:
                 if (
                     self._state == WatchState.RECORDING
                     and self._current_session is not None
                     and session_id == self._current_session.session_id
                 ):
-                    self._current_session.request_count += 1
-
-        record_with_session = {"_session_id": session_id, **record}
+                    self._current_session.request_count += request_count
 
-        self._global_logger.write_record(record_with_session)
+        self._global_logger.write_records(batch)
 
     def start_recording(self) -> SessionContext:
         """
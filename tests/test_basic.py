@@ -1,13 +1,17 @@
 """Basic tests for LLM Interceptor."""
 
+import math
+from datetime import datetime
+
 import pytest
 from mitmproxy.options import Options
 
 from lli import __version__
-from lli.config import FilterConfig, LLIConfig, ProxyConfig, load_config
+from lli.config import FilterConfig, LLIConfig, MaskingConfig, ProxyConfig, load_config
 from lli.filters import URLFilter
 from lli.models import RecordType, RequestRecord
-from lli.storage import JSONLWriter
+from lli.proxy import WatchAddon
+from lli.storage import JSONLWriter, count_records, read_jsonl
 
 
 class TestVersion:
@@ -266,6 +270,111 @@ class TestModels:
         assert record.body == body
 
 
+class TestMasking:
+    """Test sensitive header masking in the proxy addon."""
+
+    def _addon(self) -> WatchAddon:
+        config = LLIConfig()
+        return WatchAddon(config, None, URLFilter(config.filter))  # type: ignore[arg-type]
+
+    def test_mask_headers(self) -> None:
+        """Test that only sensitive headers are masked."""
+        masked = self._addon()._mask_headers(
+            {
+                "Authorization": "Bearer abcdef123456",
+                "X-Api-Key": "sk-ant1234567890abcdef",
+                "Content-Type": "application/json",
+            }
+        )
+        assert masked == {
+            "Authorization": "Bearer ***MASKED***",
+            "X-Api-Key": "sk-ant1***",
+            "Content-Type": "application/json",
+        }
+
+    def test_mask_api_key_fallbacks(self) -> None:
+        """Test masking of long keys and unmatched values."""
+        addon = self._addon()
+        assert addon._mask_api_key("a" * 40) == "aaaaaaaa***"
+        assert addon._mask_api_key("key_with.punct!") == "key_with.punct!"
+        assert addon._mask_api_key("key_with.punct!-long") == "key_with***MASKED***"
+
+    def test_mask_api_key_after_long_token(self) -> None:
+        """Test that keys directly following a long token are still masked."""
+        addon = self._addon()
+        assert addon._mask_api_key("A" * 32 + "sk-proj1234567890SECRETKEY") == (
+            "AAAAAAAA***-proj***"
+        )
+        assert addon._mask_api_key("tok" + "x" * 30 + "sk-live99999999") == "tokxxxxx***-live***"
+        assert addon._mask_api_key("x" * 40 + "Bearer  secret-token") == (
+            "xxxxxxxx***  ***MASKED***"
+        )
+
+    def test_mask_body_fields(self) -> None:
+        """Test masking of top-level and nested body fields."""
+        config = LLIConfig(
+            masking=MaskingConfig(sensitive_body_fields=["api_key", "metadata.user_id", "a.b.c"])
+        )
+        addon = WatchAddon(config, None, URLFilter(config.filter))  # type: ignore[arg-type]
+        body = {"api_key": "k", "metadata": {"user_id": "u", "other": 1}, "a": {"b": "leaf"}}
+
+        assert addon._mask_body_fields(body) == {
+            "api_key": "***MASKED***",
+            "metadata": {"user_id": "***MASKED***", "other": 1},
+            "a": {"b": "leaf"},
+        }
+        assert body["metadata"] == {"user_id": "u", "other": 1}
+
+        unmatched = {"model": "m"}
+        assert addon._mask_body_fields(unmatched) is unmatched
+
+
+class TestSSEParsing:
+    """Test SSE body parsing in the proxy addon."""
+
+    def test_iter_sse_events(self) -> None:
+        """Test that SSE events are yielded lazily and tagged with event types."""
+        config = LLIConfig()
+        addon = WatchAddon(config, None, URLFilter(config.filter))  # type: ignore[arg-type]
+        body = (
+            b'event: message_start\ndata: {"type": "message_start"}\n\n'
+            b"event: ping\r\ndata: not json\r\n\r\n"
+            b"data: [DONE]\n\n"
+        )
+
+        events = addon._iter_sse_events(body)
+        assert not isinstance(events, list)
+        assert list(events) == [
+            {"type": "message_start", "_event_type": "ping"},
+            {"raw": "not json"},
+            {"done": True},
+        ]
+        assert list(addon._iter_sse_events(b"")) == []
+
+    def test_parse_body_keeps_integers_wider_than_64_bits(self) -> None:
+        """Test that wide integers in JSON bodies and SSE events are not turned into floats."""
+        config = LLIConfig()
+        addon = WatchAddon(config, None, URLFilter(config.filter))  # type: ignore[arg-type]
+
+        body = addon._parse_body(b'{"seed": 1180591620717411303424}', "application/json")
+        assert body == {"seed": 2**70}
+        assert isinstance(body["seed"], int)
+
+        events = list(addon._iter_sse_events(b'data: {"seed": -9223372036854775809}\n\n'))
+        assert events == [{"seed": -(2**63) - 1}]
+
+    def test_parse_body_accepts_nan_and_lone_surrogates(self) -> None:
+        """Test that JSON accepted by the json module is still parsed."""
+        config = LLIConfig()
+        addon = WatchAddon(config, None, URLFilter(config.filter))  # type: ignore[arg-type]
+
+        body = addon._parse_body(b'{"score": NaN, "max": Infinity}', "application/json")
+        assert math.isnan(body["score"])
+        assert body["max"] == math.inf
+
+        assert addon._parse_body(b'{"text": "\\ud800"}', None) == {"text": "\ud800"}
+
+
 class TestStorage:
     """Test storage module."""
 
@@ -290,3 +399,76 @@ class TestStorage:
             content = f.read()
         assert "request" in content
         assert "anthropic" in content
+
+    def test_jsonl_writer_write_records(self, tmp_path: pytest.TempPathFactory) -> None:
+        """Test writing a batch of records to JSONL."""
+        output_file = tmp_path / "test.jsonl"  # type: ignore
+        with JSONLWriter(output_file, buffer_size=1 << 16) as writer:
+            writer.write_records([{"type": "request", "id": "a"}, {"type": "response"}])
+            assert writer.record_count == 2
+
+        assert list(read_jsonl(output_file)) == [
+            {"type": "request", "id": "a"},
+            {"type": "response"},
+        ]
+
+    def test_jsonl_writer_serializes_datetimes(self, tmp_path: pytest.TempPathFactory) -> None:
+        """Test that datetimes in plain dict records are written as ISO strings."""
+        output_file = tmp_path / "test.jsonl"  # type: ignore
+        with JSONLWriter(output_file) as writer:
+            writer.write_record({"nested": [{"timestamp": datetime(2025, 1, 2, 3, 4, 5)}]})
+
+        assert list(read_jsonl(output_file)) == [
+            {"nested": [{"timestamp": "2025-01-02T03:04:05Z"}]}
+        ]
+
+    def test_read_jsonl_streams_and_skips_invalid_lines(
+        self, tmp_path: pytest.TempPathFactory
+    ) -> None:
+        """Test that read_jsonl yields records lazily and skips bad lines."""
+        input_file = tmp_path / "test.jsonl"  # type: ignore
+        input_file.write_text('{"type": "request"}\n\nnot json\n{"type": "response"}\n')
+
+        records = read_jsonl(input_file)
+        assert not isinstance(records, list)
+        assert list(records) == [{"type": "request"}, {"type": "response"}]
+
+    def test_jsonl_round_trips_integers_wider_than_64_bits(
+        self, tmp_path: pytest.TempPathFactory
+    ) -> None:
+        """Test that integers outside the 64-bit range are read and written exactly."""
+        input_file = tmp_path / "wide.jsonl"  # type: ignore
+        output_file = tmp_path / "copy.jsonl"  # type: ignore
+        lines = [
+            '{"type":"response","body":{"seed":1180591620717411303424}}',
+            '{"type":"response","body":{"seed":-9223372036854775809,"ok":1.5}}',
+        ]
+        input_file.write_text("\n".join(lines) + "\n")
+
+        records = list(read_jsonl(input_file))
+        assert records[0]["body"]["seed"] == 2**70
+        assert records[1]["body"]["seed"] == -(2**63) - 1
+
+        with JSONLWriter(output_file) as writer:
+            writer.write_records(records)
+
+        assert output_file.read_text().splitlines() == lines
+
+    def test_count_records_by_type(self, tmp_path: pytest.TempPathFactory) -> None:
+        """Test counting records with and without a leading type field."""
+        input_file = tmp_path / "test.jsonl"  # type: ignore
+        input_file.write_text(
+            '{"type":"request","body":{"type":"message"}}\n'
+            '{"_session_id":"abc","type":"response_chunk"}\n'
+            '{"_session_id":null,"type":"response_chunk"}\n'
+            '{"id": "x", "type": "response"}\n'
+            '{"no_type": true}\n'
+            '{"type":"request","trunc\n'
+        )
+
+        assert count_records(input_file) == {
+            "request": 1,
+            "response_chunk": 2,
+            "response": 1,
+            "unknown": 1,
+        }
@@ -1,12 +1,23 @@
 """Tests for stream merger functionality."""
 
-import json
 from datetime import datetime
 from pathlib import Path
 
+import orjson
+
 from lli.merger import StreamMerger
 
 
+def _write_jsonl(path: Path, records: list[dict]) -> None:
+    """Write records to a JSONL fixture file in one call."""
+    path.write_bytes(b"".join(orjson.dumps(record) + b"\n" for record in records))
+
+
+def _load_jsonl(path: Path) -> list[dict]:
+    """Read a JSONL output file into a list of records."""
+    return [orjson.loads(line) for line in path.read_bytes().splitlines() if line]
+
+
 class TestExtractTextFromChunks:
     """Test text extraction from streaming chunks."""
 
@@ -528,6 +539,48 @@ class TestDetectApiFormat:
         result = merger._detect_api_format(chunks)
         assert result == "anthropic"
 
+    def test_detect_from_request_url(self, tmp_path: Path) -> None:
+        """Test that known provider hosts decide the format without chunks."""
+        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+        chunks = [{"content": {"type": "ping"}}]
+
+        assert (
+            merger._detect_api_format(chunks, "https://api.openai.com/v1/chat/completions")
+            == "openai"
+        )
+        assert merger._detect_api_format([], "https://api.anthropic.com/v1/messages") == "anthropic"
+        # Unknown hosts fall back to inspecting chunk contents
+        assert merger._detect_api_format(chunks, "https://llm.example.com/v1/chat") == "anthropic"
+
+    def test_detect_openai_format_on_anthropic_compat_endpoint(self, tmp_path: Path) -> None:
+        """Test that OpenAI-format chunks from Anthropic's compat endpoint are not misrouted."""
+        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+        chunks = [{"content": {"choices": [{"delta": {"content": "Hi"}}]}}]
+
+        assert (
+            merger._detect_api_format(chunks, "https://api.anthropic.com/v1/chat/completions")
+            == "openai"
+        )
+
+    def test_detect_ignores_lookalike_hosts(self, tmp_path: Path) -> None:
+        """Test that hosts merely ending in a provider name fall back to the chunks."""
+        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+        chunks = [{"content": {"choices": [{"delta": {"content": "Hi"}}]}}]
+
+        assert (
+            merger._detect_api_format(chunks, "https://evil-notanthropic.com/v1/messages")
+            == "openai"
+        )
+        assert (
+            merger._detect_api_format(
+                [{"content": {"type": "ping"}}], "https://notopenai.com/v1/chat/completions"
+            )
+            == "anthropic"
+        )
+
 
 class TestRebuildAnthropicResponse:
     """Test rebuilding Anthropic API response from chunks."""
@@ -967,9 +1020,7 @@ class TestStreamMergerIntegration:
             },
         ]
 
-        with open(input_file, "w", encoding="utf-8") as f:
-            for record in records:
-                f.write(json.dumps(record) + "\n")
+        _write_jsonl(input_file, records)
 
         merger = StreamMerger(input_file, output_file)
         stats = merger.merge()
@@ -978,18 +1029,17 @@ class TestStreamMergerIntegration:
         assert stats["total_chunks_processed"] == 4
 
         # Verify output has 2 lines: request and response
-        with open(output_file, encoding="utf-8") as f:
-            lines = f.readlines()
+        lines = _load_jsonl(output_file)
 
         assert len(lines) == 2
 
         # First line should be the original request
-        request_line = json.loads(lines[0])
+        request_line = lines[0]
         assert request_line["type"] == "request"
         assert request_line["id"] == request_id
 
         # Second line should be the rebuilt response
-        response_line = json.loads(lines[1])
+        response_line = lines[1]
         assert response_line["type"] == "response"
         assert response_line["request_id"] == request_id
         assert response_line["status_code"] == 200
@@ -1051,25 +1101,22 @@ class TestStreamMergerIntegration:
             },
         ]
 
-        with open(input_file, "w", encoding="utf-8") as f:
-            for record in records:
-                f.write(json.dumps(record) + "\n")
+        _write_jsonl(input_file, records)
 
         merger = StreamMerger(input_file, output_file)
         stats = merger.merge()
 
         assert stats["streaming_requests"] == 1
 
-        with open(output_file, encoding="utf-8") as f:
-            lines = f.readlines()
+        lines = _load_jsonl(output_file)
 
         assert len(lines) == 2
 
-        request_line = json.loads(lines[0])
+        request_line = lines[0]
         assert request_line["type"] == "request"
         assert request_line["id"] == request_id
 
-        response_line = json.loads(lines[1])
+        response_line = lines[1]
         assert response_line["type"] == "response"
         assert response_line["body"]["id"] == "chatcmpl-test"
         assert response_line["body"]["choices"][0]["message"]["content"] == "Hello from GPT!"
@@ -1104,24 +1151,21 @@ class TestStreamMergerIntegration:
             original_response,
         ]
 
-        with open(input_file, "w", encoding="utf-8") as f:
-            for record in records:
-                f.write(json.dumps(record) + "\n")
+        _write_jsonl(input_file, records)
 
         merger = StreamMerger(input_file, output_file)
         stats = merger.merge()
 
         assert stats["non_streaming_requests"] == 1
 
-        with open(output_file, encoding="utf-8") as f:
-            lines = f.readlines()
+        lines = _load_jsonl(output_file)
 
         assert len(lines) == 2
 
-        request_line = json.loads(lines[0])
+        request_line = lines[0]
         assert request_line["type"] == "request"
 
-        response_line = json.loads(lines[1])
+        response_line = lines[1]
         assert response_line == original_response
 
     def test_merge_mixed_requests_maintains_order(self, tmp_path: Path) -> None:
@@ -1193,9 +1237,7 @@ class TestStreamMergerIntegration:
             },
         ]
 
-        with open(input_file, "w", encoding="utf-8") as f:
-            for record in records:
-                f.write(json.dumps(record) + "\n")
+        _write_jsonl(input_file, records)
 
         merger = StreamMerger(input_file, output_file)
         stats = merger.merge()
@@ -1204,30 +1246,101 @@ class TestStreamMergerIntegration:
         assert stats["non_streaming_requests"] == 1
         assert stats["total_requests"] == 2
 
-        with open(output_file, encoding="utf-8") as f:
-            lines = f.readlines()
+        lines = _load_jsonl(output_file)
 
         # Should have 4 lines: req1, resp1, req2, resp2
         assert len(lines) == 4
 
         # Verify order
-        line0 = json.loads(lines[0])
+        line0 = lines[0]
         assert line0["type"] == "request"
         assert line0["id"] == "stream_req"
 
-        line1 = json.loads(lines[1])
+        line1 = lines[1]
         assert line1["type"] == "response"
         assert line1["request_id"] == "stream_req"
         assert line1["body"]["content"][0]["text"] == "Streamed"
 
-        line2 = json.loads(lines[2])
+        line2 = lines[2]
         assert line2["type"] == "request"
         assert line2["id"] == "non_stream_req"
 
-        line3 = json.loads(lines[3])
+        line3 = lines[3]
         assert line3["type"] == "response"
         assert line3["request_id"] == "non_stream_req"
 
+    def test_merge_sorts_out_of_order_chunks(self, tmp_path: Path) -> None:
+        """Test that chunks written out of order are merged by chunk_index."""
+        input_file = tmp_path / "input.jsonl"
+        output_file = tmp_path / "output.jsonl"
+
+        records = [
+            {
+                "type": "request",
+                "id": "req_unordered",
+                "timestamp": "2025-01-01T12:00:00Z",
+                "method": "POST",
+                "url": "https://api.openai.com/v1/chat/completions",
+            },
+            {
+                "type": "response_chunk",
+                "request_id": "req_unordered",
+                "chunk_index": 1,
+                "content": {"choices": [{"index": 0, "delta": {"content": "World"}}]},
+            },
+            {
+                "type": "response_chunk",
+                "request_id": "req_unordered",
+                "chunk_index": 0,
+                "content": {"choices": [{"index": 0, "delta": {"content": "Hello "}}]},
+            },
+        ]
+
+        _write_jsonl(input_file, records)
+
+        merger = StreamMerger(input_file, output_file)
+        stats = merger.merge()
+
+        assert stats["streaming_requests"] == 1
+        assert stats["total_chunks_processed"] == 2
+
+        lines = _load_jsonl(output_file)
+
+        response_line = lines[1]
+        assert response_line["body"]["choices"][0]["message"]["content"] == "Hello World"
+
+    def test_merge_keeps_request_order_when_responses_interleave(self, tmp_path: Path) -> None:
+        """Test that output follows request order even if responses finish out of order."""
+        input_file = tmp_path / "input.jsonl"
+        output_file = tmp_path / "output.jsonl"
+
+        records = [
+            {"type": "request", "id": "req_a", "method": "POST", "url": "https://x/a"},
+            {"type": "request", "id": "req_b", "method": "POST", "url": "https://x/b"},
+            {"type": "request", "id": "req_c", "method": "POST", "url": "https://x/c"},
+            {"type": "response", "request_id": "req_b", "body": {"id": "b"}},
+            {"type": "response", "request_id": "req_a", "body": {"id": "a"}},
+        ]
+
+        _write_jsonl(input_file, records)
+
+        merger = StreamMerger(input_file, output_file)
+        stats = merger.merge()
+
+        assert stats["total_requests"] == 3
+        assert stats["non_streaming_requests"] == 2
+        assert stats["incomplete_requests"] == 1
+
+        lines = _load_jsonl(output_file)
+
+        assert [(r["type"], r.get("id") or r.get("request_id")) for r in lines] == [
+            ("request", "req_a"),
+            ("response", "req_a"),
+            ("request", "req_b"),
+            ("response", "req_b"),
+            ("request", "req_c"),
+        ]
+
     def test_merge_incomplete_request_outputs_only_request(self, tmp_path: Path) -> None:
         """Test that incomplete requests only output the request line."""
         input_file = tmp_path / "input.jsonl"
@@ -1243,59 +1356,133 @@ class TestStreamMergerIntegration:
             },
         ]
 
-        with open(input_file, "w", encoding="utf-8") as f:
-            for record in records:
-                f.write(json.dumps(record) + "\n")
+        _write_jsonl(input_file, records)
 
         merger = StreamMerger(input_file, output_file)
         stats = merger.merge()
 
         assert stats["incomplete_requests"] == 1
 
-        with open(output_file, encoding="utf-8") as f:
-            lines = f.readlines()
+        lines = _load_jsonl(output_file)
 
         # Should only have the request line
         assert len(lines) == 1
-        line = json.loads(lines[0])
+        line = lines[0]
         assert line["type"] == "request"
         assert line["id"] == "orphan_request"
 
+    def test_merge_failed_request_meta_completes_request(self, tmp_path: Path) -> None:
+        """Test that the error meta written for a failed flow releases it as incomplete."""
+        input_file = tmp_path / "input.jsonl"
+        output_file = tmp_path / "output.jsonl"
+
+        records = [
+            {"type": "request", "id": "req_a", "method": "POST", "url": "https://x/a"},
+            {"type": "request", "id": "req_b", "method": "POST", "url": "https://x/b"},
+            {
+                "type": "response_meta",
+                "request_id": "req_a",
+                "status_code": None,
+                "total_chunks": 0,
+                "error": "client disconnected",
+            },
+            {"type": "response", "request_id": "req_b", "body": {"id": "b"}},
+        ]
+
+        _write_jsonl(input_file, records)
+
+        merger = StreamMerger(input_file, output_file)
+        stats = merger.merge()
+
+        assert stats["incomplete_requests"] == 1
+        assert stats["non_streaming_requests"] == 1
+
+        lines = _load_jsonl(output_file)
+
+        assert [(r["type"], r.get("id") or r.get("request_id")) for r in lines] == [
+            ("request", "req_a"),
+            ("request", "req_b"),
+            ("response", "req_b"),
+        ]
+
+    def test_merge_in_place_keeps_input_records(self, tmp_path: Path) -> None:
+        """Test that merging a file onto itself replaces it with the merged output."""
+        trace_file = tmp_path / "trace.jsonl"
+
+        records = [
+            {"type": "request", "id": "req_1", "method": "POST", "url": "https://x/a"},
+            {"type": "response", "request_id": "req_1", "body": {"id": "r1"}},
+            {"type": "request", "id": "req_2", "method": "POST", "url": "https://x/b"},
+            {"type": "response", "request_id": "req_2", "body": {"id": "r2"}},
+        ]
+
+        _write_jsonl(trace_file, records)
+
+        merger = StreamMerger(trace_file, trace_file)
+        stats = merger.merge()
+
+        assert stats["total_requests"] == 2
+        assert stats["non_streaming_requests"] == 2
+        assert _load_jsonl(trace_file) == records
+        assert list(tmp_path.iterdir()) == [trace_file]
+
 
 class TestParseTimestamp:
     """Test timestamp parsing."""
 
-    def test_parse_iso_format(self, tmp_path: Path) -> None:
+    def test_parse_iso_format(self) -> None:
         """Test parsing ISO format timestamp."""
-        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
-
-        result = merger._parse_timestamp("2025-01-15T10:30:00")
+        result = StreamMerger._parse_timestamp("2025-01-15T10:30:00")
         assert result.year == 2025
         assert result.month == 1
         assert result.day == 15
         assert result.hour == 10
         assert result.minute == 30
 
-    def test_parse_iso_format_with_z(self, tmp_path: Path) -> None:
+    def test_parse_iso_format_with_z(self) -> None:
         """Test parsing ISO format timestamp with Z suffix."""
-        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
-
-        result = merger._parse_timestamp("2025-01-15T10:30:00Z")
+        result = StreamMerger._parse_timestamp("2025-01-15T10:30:00Z")
         assert result.year == 2025
         assert result.hour == 10
 
-    def test_parse_datetime_object(self, tmp_path: Path) -> None:
-        """Test passing datetime object directly."""
-        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+    def test_parse_fractional_seconds_with_z(self) -> None:
+        """Test parsing ISO timestamp with microseconds and Z suffix."""
+        result = StreamMerger._parse_timestamp("2025-01-15T10:30:00.123456Z")
+        assert result == datetime(2025, 1, 15, 10, 30, 0, 123456)
+
+    def test_parse_date_only(self) -> None:
+        """Test parsing an ISO date without a time part."""
+        result = StreamMerger._parse_timestamp("2025-01-15")
+        assert result == datetime(2025, 1, 15)
+
+    def test_parse_without_seconds(self) -> None:
+        """Test parsing an ISO timestamp without seconds."""
+        result = StreamMerger._parse_timestamp("2025-01-15T10:30")
+        assert result == datetime(2025, 1, 15, 10, 30)
+
+    def test_parse_repeated_string(self) -> None:
+        """Test that parsing the same string twice gives the same value."""
+        first = StreamMerger._parse_timestamp("2025-01-15T10:30:00.500Z")
+        second = StreamMerger._parse_timestamp("2025-01-15T10:30:00.500Z")
+        assert first == second == datetime(2025, 1, 15, 10, 30, 0, 500000)
 
+    def test_parse_str_subclass(self) -> None:
+        """Test that str subclasses are parsed like plain strings."""
+
+        class Timestamp(str):
+            pass
+
+        result = StreamMerger._parse_timestamp(Timestamp("2025-01-15T10:30:00Z"))
+        assert result == datetime(2025, 1, 15, 10, 30)
+
+    def test_parse_datetime_object(self) -> None:
+        """Test passing datetime object directly."""
         dt = datetime(2025, 6, 15, 14, 30)
-        result = merger._parse_timestamp(dt)
+        result = StreamMerger._parse_timestamp(dt)
         assert result == dt
 
-    def test_parse_invalid_fallback(self, tmp_path: Path) -> None:
+    def test_parse_invalid_fallback(self) -> None:
         """Test fallback for invalid timestamp."""
-        merger = StreamMerger(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
-
-        result = merger._parse_timestamp("invalid")
+        result = StreamMerger._parse_timestamp("invalid")
         # Should return current time (approximately)
         assert isinstance(result, datetime)
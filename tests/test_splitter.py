@@ -0,0 +1,45 @@
+import json
+
+from lli.splitter import RecordSplitter, split_records
+
+
+def test_split_writes_request_and_response_files(tmp_path) -> None:
+    input_file = tmp_path / "merged.jsonl"
+    output_dir = tmp_path / "split"
+    request = {
+        "type": "request",
+        "id": "req_1",
+        "timestamp": "2025-11-26T14:12:47Z",
+        "body": {"messages": [{"role": "user", "content": "héllo"}]},
+    }
+    response = {
+        "type": "response",
+        "request_id": "req_1",
+        "timestamp": "2025-11-26T14:12:48Z",
+        "body": {"content": []},
+    }
+    input_file.write_text(
+        json.dumps(request) + "\n" + json.dumps(response) + "\n", encoding="utf-8"
+    )
+
+    stats = split_records(input_file, output_dir)
+
+    assert stats == {"total_records": 2, "request_files": 1, "response_files": 1, "errors": 0}
+    request_file = output_dir / "001_request_2025-11-26_14-12-47.json"
+    response_file = output_dir / "001_response_2025-11-26_14-12-48.json"
+    assert request_file.read_text(encoding="utf-8") == json.dumps(
+        request, indent=2, ensure_ascii=False
+    )
+    assert json.loads(response_file.read_text(encoding="utf-8")) == response
+
+
+def test_split_writes_integers_wider_than_64_bits(tmp_path) -> None:
+    output_dir = tmp_path / "split"
+    output_dir.mkdir()
+    record = {"type": "response", "request_id": "req_1", "body": {"seed": 2**70, "n": 1}}
+
+    RecordSplitter(tmp_path / "merged.jsonl", output_dir)._write_json_file("big.json", record)
+
+    written = (output_dir / "big.json").read_text(encoding="utf-8")
+    assert written == json.dumps(record, indent=2, ensure_ascii=False)
+    assert json.loads(written)["body"]["seed"] == 2**70
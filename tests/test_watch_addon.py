@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+
+from mitmproxy.test import tflow, tutils
+
+from lli.config import LLIConfig
+from lli.filters import URLFilter
+from lli.proxy import WatchAddon
+from lli.watch import WatchManager
+
+
+def _captured_records(mgr: WatchManager) -> list[dict]:
+    return [
+        json.loads(ln)
+        for ln in mgr.global_log_path.read_text(encoding="utf-8").splitlines()
+        if '"_meta_type"' not in ln
+    ]
+
+
+def _flow(content_type: str, content: bytes):
+    req = tutils.treq(
+        host="api.anthropic.com",
+        port=443,
+        scheme=b"https",
+        authority=b"api.anthropic.com",
+        path=b"/v1/messages",
+        method=b"POST",
+        headers=((b"content-type", b"application/json"),),
+        content=b'{"model": "claude"}',
+    )
+    resp = tutils.tresp(
+        headers=((b"content-type", content_type.encode()),),
+        content=content,
+    )
+    return tflow.tflow(req=req, resp=resp)
+
+
+def _run_flow(addon: WatchAddon, flow) -> None:
+    addon.request(flow)
+    asyncio.run(addon.response(flow))
+    addon.done()
+
+
+def test_response_writes_streaming_chunks_and_meta(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        session = mgr.start_recording()
+        config = LLIConfig()
+        addon = WatchAddon(config, mgr, URLFilter(config.filter))
+
+        sse = (
+            b"event: message_start\n"
+            b'data: {"type": "message_start"}\n\n'
+            b"event: content_block_delta\n"
+            b'data: {"type": "content_block_delta", "delta": {"text": "hi"}}\n\n'
+        )
+        _run_flow(addon, _flow("text/event-stream", sse))
+
+        records = _captured_records(mgr)
+        assert [r["type"] for r in records] == [
+            "request",
+            "response_chunk",
+            "response_chunk",
+            "response_meta",
+        ]
+        request_id = records[0]["id"]
+        assert all(r["request_id"] == request_id for r in records[1:])
+        assert [r["chunk_index"] for r in records[1:3]] == [0, 1]
+        assert records[2]["content"]["delta"] == {"text": "hi"}
+        assert records[3]["total_chunks"] == 2
+        assert all(r["_session_id"] == session.session_id for r in records)
+    finally:
+        mgr.shutdown()
+
+
+def test_response_offloads_large_non_streaming_body(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        session = mgr.start_recording()
+        config = LLIConfig()
+        addon = WatchAddon(config, mgr, URLFilter(config.filter))
+
+        text = "x" * (128 * 1024)
+        body = json.dumps({"content": [{"type": "text", "text": text}]}).encode()
+        flow = _flow("application/json", body)
+        flow.response.headers["x-api-key"] = "sk-ant1234567890abcdef"
+        _run_flow(addon, flow)
+
+        records = _captured_records(mgr)
+        assert [r["type"] for r in records] == ["request", "response"]
+        response = records[1]
+        assert response["request_id"] == records[0]["id"]
+        assert response["status_code"] == 200
+        assert response["body"]["content"][0]["text"] == text
+        assert response["headers"]["x-api-key"] == "sk-ant1***"
+        assert response["_session_id"] == session.session_id
+    finally:
+        mgr.shutdown()
+
+
+def test_done_waits_for_pending_writes(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        mgr.start_recording()
+        config = LLIConfig()
+        addon = WatchAddon(config, mgr, URLFilter(config.filter))
+
+        flow = _flow("text/event-stream", b'data: {"type": "ping"}\n\n')
+        addon.request(flow)
+        request_id = flow.metadata["lli_request_id"]
+        addon._executor.submit(
+            addon._write_streaming_response,
+            request_id,
+            mgr.current_session_id,
+            200,
+            flow.response.content,
+            time.time(),
+            1.0,
+        )
+        addon.done()
+
+        assert [r["type"] for r in _captured_records(mgr)] == [
+            "request",
+            "response_chunk",
+            "response_meta",
+        ]
+    finally:
+        mgr.shutdown()
+
+
+def test_error_writes_terminal_meta_for_failed_flow(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        mgr.start_recording()
+        config = LLIConfig()
+        addon = WatchAddon(config, mgr, URLFilter(config.filter))
+
+        flow = _flow("text/event-stream", b"")
+        flow.response = None
+        flow.error = tflow.terr("client disconnected")
+        addon.request(flow)
+        addon.error(flow)
+        addon.done()
+
+        records = _captured_records(mgr)
+        assert [r["type"] for r in records] == ["request", "response_meta"]
+        meta = records[1]
+        assert meta["request_id"] == records[0]["id"]
+        assert meta["status_code"] is None
+        assert meta["total_chunks"] == 0
+        assert meta["error"] == "client disconnected"
+    finally:
+        mgr.shutdown()
+
+
+def test_error_after_response_writes_nothing_more(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        mgr.start_recording()
+        config = LLIConfig()
+        addon = WatchAddon(config, mgr, URLFilter(config.filter))
+
+        flow = _flow("application/json", b'{"ok": true}')
+        addon.request(flow)
+        asyncio.run(addon.response(flow))
+        flow.error = tflow.terr("client disconnected")
+        addon.error(flow)
+        addon.done()
+
+        assert [r["type"] for r in _captured_records(mgr)] == ["request", "response"]
+    finally:
+        mgr.shutdown()
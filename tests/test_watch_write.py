@@ -0,0 +1,57 @@
+import json
+
+from lli.watch import WatchManager
+
+
+def test_write_records_batch_injects_session_and_counts_requests(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        session = mgr.start_recording()
+
+        mgr.write_records(
+            [
+                {"type": "request", "id": "req_1"},
+                {"type": "response_chunk", "request_id": "req_1", "chunk_index": 0},
+                {"type": "response_meta", "request_id": "req_1", "total_chunks": 1},
+            ]
+        )
+        assert session.request_count == 1
+
+        records = [
+            json.loads(ln)
+            for ln in mgr.global_log_path.read_text(encoding="utf-8").splitlines()
+            if '"_meta_type"' not in ln
+        ]
+        assert [r["type"] for r in records] == ["request", "response_chunk", "response_meta"]
+        assert all(r["_session_id"] == session.session_id for r in records)
+    finally:
+        mgr.shutdown()
+
+
+def test_write_records_falls_back_for_records_orjson_rejects(tmp_path) -> None:
+    mgr = WatchManager(output_dir=tmp_path, port=1234)
+    mgr.initialize()
+    try:
+        session = mgr.start_recording()
+
+        mgr.write_record({"type": "request", "id": "req_1", "body": {"seed": 2**70}})
+        mgr.write_records(
+            [
+                {"type": "response", "request_id": "req_1", "body": {1: "one"}},
+                {"type": "response_meta", "request_id": "req_1", "text": "\ud800"},
+            ]
+        )
+
+        records = [
+            json.loads(ln)
+            for ln in mgr.global_log_path.read_text(encoding="utf-8").splitlines()
+            if '"_meta_type"' not in ln
+        ]
+        assert [r["type"] for r in records] == ["request", "response", "response_meta"]
+        assert records[0]["body"]["seed"] == 2**70
+        assert records[1]["body"] == {"1": "one"}
+        assert records[2]["text"] == "\ud800"
+        assert all(r["_session_id"] == session.session_id for r in records)
+    finally:
+        mgr.shutdown()